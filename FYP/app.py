@@ -1,11 +1,13 @@
-from flask import Flask, render_template, request, redirect, flash, get_flashed_messages
-from plotters.plotter import Plotter
-from classifier import classify
-import matplotlib.pyplot as plt
+from flask import Flask, render_template, request, redirect, flash, get_flashed_messages, jsonify, url_for
+from plotters.render import renderHeatmap
+from classifier import classify, getClassifier
+from corpus import CorpusIndex
+from jobs import JobQueue
+from pi import getSession
+from recorder import SegmentRecorder
 import os
-import random
-import glob
-import paramiko
+import re
+import shlex
 import uuid
 import socket
 import subprocess
@@ -13,6 +15,19 @@ import subprocess
 app = Flask(__name__)
 app.secret_key = 'secret123'
 
+# Captures in data/ with their metadata and pre-rendered heatmaps
+corpus = CorpusIndex(os.path.join(os.path.abspath(os.path.dirname(__file__)), "data"))
+# Built in the background as soon as the app is, also under flask run / WSGI
+corpus.start()
+# Recordings run in the background, the request only gets a job id
+jobs = JobQueue()
+# Rolling recording written by ingest.py / clientListener.py, if they run
+recorder = SegmentRecorder()
+RECORDING_SECONDS = 3
+# Transmitter the Pis extract CSI from (mcp -m), frames of other
+# devices or Pis in the recording must not be mixed into its series
+CSI_MAC = "B4:86:55:F4:8B:9E"
+
 
 @app.route('/', methods=['GET', 'POST'])
 def index():
@@ -27,27 +42,22 @@ def index():
     if request.method == 'POST':
         selectedActivity = selected = request.form['activity']
         print(selectedActivity)
-        randomPcapFile = getPcapFileBasedOnActivity(selectedActivity)
-        createPlotter(randomPcapFile)
-        plotPath = os.path.join('static/images', 'generated.png')
+        entry = corpus.randomEntry(selectedActivity)
+        if entry is None:
+            flash(f'No {selectedActivity} captures found.')
+            return redirect('/')
+        plotPath = entry['plot'] if entry['plot'] and os.path.exists(entry['plot']) else createPlotter(entry['path'])
         # plotPath = 'generated.png'
         return render_template('index.html', plot_path=plotPath, selected=selected)
     return render_template('index.html', activities=activities,  messages=messages)
 
 def createPlotter(pcapFile):
-    plotter = Plotter(pcapFile, 200, 80)
-    plotter.heatmap()
-    plt.savefig('static/images/generated.png')
+    # Path of the cached heatmap of pcapFile, rendered if needed
+    return renderHeatmap(pcapFile, window_size=200, bandwidth=80)
 
 def getPcapFileBasedOnActivity(activity):
-    baseDir = os.path.abspath(os.path.dirname(__file__))
-    # /{activity}-*.pcap
-    pattern = f"data\{activity}-*.pcap"
-    folderPath = os.path.join(baseDir, pattern)
-    fileList = glob.glob(folderPath)
-    randomPcapFile = random.choice(fileList)
-
-    return os.path.join(folderPath, randomPcapFile)
+    entry = corpus.randomEntry(activity)
+    return entry['path'] if entry else None
 
 def getMacAddress():
     hostname = socket.gethostname()
@@ -59,15 +69,12 @@ def runCommandOnPi():
     rpiIP = "192.168.1.154"
     macOfDevice =getMacAddress().upper()
 
-    ssh = paramiko.SSHClient()
-    ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-    ssh.connect(rpiIP, username="pi", password="pi1234")
+    pi = getSession(rpiIP)
 
-    # stdin, stdout, stderr = ssh.exec_command(f"mcp -C 1 -N 1 -c 36/80 -m {macOfDevice}")
+    # result = pi.run(f"mcp -C 1 -N 1 -c 36/80 -m {macOfDevice}")
 
     # debugging
-    stdin, stdout, stderr = ssh.exec_command(f"mcp -C 1 -N 1 -c 36/80 -m B4:86:55:F4:8B:9E")
-    result = stdout.read().decode()
+    result = pi.run(f"mcp -C 1 -N 1 -c 36/80 -m {CSI_MAC}")
 
     results = []
     commands = [
@@ -77,45 +84,71 @@ def runCommandOnPi():
         "sudo ip link set mon0 up"
     ]
     for command in commands:
-        stdin, stdout, stderr = ssh.exec_command(command)
-        r = stdout.read().decode()
+        r = pi.run(command)
         results.append(r)
-    ssh.close()
     flash('Command executed successfully.')
     return redirect('/')
 
-@app.route('/record-activity', methods=['POST'])
-def recordActivity():
-    activity = request.form['activity'].lower()
-    rpiIP = "192.168.1.190"
-    macOfDevice = getMacAddress().upper()
+def recordAndClassify(activity, recordingId):
+    filePath = f'generated/data/{recordingId}.pcap'
 
-    ssh = paramiko.SSHClient()
-    ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-    ssh.connect(rpiIP, username="pi", password="pi1234")
-    results = []
-    commands = [
-        # f"sudo tcpdump -i wlan0 dst port 5500 -vv -w {activity}-%s.pcap -G 3 -W 1 -Z root",
-        f"sudo tcpdump -i wlan0 dst port 5500 -vv -w {activity}.pcap -G 3 -W 1 -Z root"
-    ]
-    for command in commands:
-        stdin, stdout, stderr = ssh.exec_command(command)
-        r = stdout.read().decode()
-        results.append(r)
+    try:
+        # The last seconds of the local recording, when frames are still coming in
+        if not recorder.exportLast(RECORDING_SECONDS, filePath, mac=CSI_MAC):
+            rpiIP = "192.168.1.190"
+            pi = getSession(rpiIP)
+
+            # Unique names so recordings can run at the same time
+            remotePath = f"{activity}-{recordingId}.pcap"
+            pi.run(f"sudo tcpdump -i wlan0 dst port 5500 -vv -w {shlex.quote(remotePath)} -G {RECORDING_SECONDS} -W 1 -Z root")
+
+            # transferring recorded activity pcap file
+            pi.get(remotePath, filePath)
+            pi.run(f"rm {shlex.quote(remotePath)}")
 
-    # transferring recorded activity pcap file
-    sftp = ssh.open_sftp()
-    filePath = f'generated/data/generated.pcap'
-    sftp.get(f'generated.pcap', filePath)
-    print(filePath)
-    sftp.close()
-    classifiedActivity = classify(pcapFile=filePath)
-    createPlotter(filePath)
-    # stdin, stdout, stderr = ssh.exec_command(f"sudo tcpdump -i wlan0 dst port 5500 -vv -w test-%s.pcap -G 3 -W 1 -Z root")
-    # result = stdout.read().decode()
-    plotPath = os.path.join('static/images', 'generated.png')
-    return render_template('index.html', plot_path=plotPath, classifiedActivity=classifiedActivity)
+        return {
+            "classifiedActivity": classify(pcapFile=filePath),
+            # heatmaps are cached by content, the png outlives the capture
+            "plot_path": createPlotter(filePath),
+        }
+    finally:
+        if os.path.exists(filePath):
+            os.remove(filePath)
+
+@app.route('/record-activity', methods=['POST'])
+def recordActivity():
+    # Used in file names on the Pi (tcpdump runs as root), letters only
+    activity = re.sub('[^a-z]', '', request.form['activity'].lower()) or "activity"
+    jobId = jobs.submit(recordAndClassify, activity, uuid.uuid4().hex)
+    return redirect(f'/record-activity/{jobId}')
+
+@app.route('/record-activity/<jobId>')
+def recordActivityResult(jobId):
+    job = jobs.get(jobId)
+    if job is None:
+        flash('Unknown recording.')
+        return redirect('/')
+    if job["status"] == "failed":
+        flash(f'Recording failed: {job["error"]}')
+        return redirect('/')
+    if job["status"] != "done":
+        # The page refreshes itself until the job is done
+        return render_template('index.html', job=job)
+
+    result = dict(job["result"])
+    # plot_path is relative to FYP, the page is one level down
+    result["plot_path"] = url_for('static', filename=os.path.relpath(result["plot_path"], 'static'))
+    return render_template('index.html', **result)
+
+@app.route('/jobs/<jobId>')
+def jobStatus(jobId):
+    job = jobs.get(jobId)
+    if job is None:
+        return jsonify({"error": "unknown job"}), 404
+    return jsonify(job)
 
 
 if __name__ == '__main__':
+    # Load the model before the first request needs it
+    getClassifier()
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,71 @@
+import numpy as np
+from time import perf_counter
+from decoders.realtimecsi import hampel_filter
+
+'''
+Hampel filter benchmark
+-----------------------
+
+Compares decoders.realtimecsi.hampel_filter with the
+original per-subcarrier loop it replaced, on the
+amplitude windows used by the live plotter.
+
+Run from the FYP directory:
+python -m benchmarks.hampel
+'''
+
+
+def hampel_filter_loop(input_series, window_size, n_subcarriers, n_sigmas=3):
+    new_series = input_series.copy()
+    k = 1.4826  # scale factor for Gaussian distribution
+    n = len(new_series[0, :])
+    for s in range(n_subcarriers):
+        amplitudeOfSubcarrier = new_series[s, :].copy()
+
+        for i in range(window_size, n - window_size + 1):
+            x0 = np.nanmedian(amplitudeOfSubcarrier[i - window_size:i + window_size])
+            S0 = k * np.nanmedian(np.abs(amplitudeOfSubcarrier[i - window_size:i + window_size] - x0))
+
+            if i - window_size == 0:  # if first and last values not available
+                for j in range(window_size + 1):
+                    if np.abs(amplitudeOfSubcarrier[j] - x0) > n_sigmas * S0:
+                        new_series[s, j] = x0
+            elif i + window_size == n - 1:
+                for j in range(n - window_size, n):
+                    if np.abs(amplitudeOfSubcarrier[j] - x0) > n_sigmas * S0:
+                        new_series[s, j] = x0
+            else:
+                if np.abs(amplitudeOfSubcarrier[i] - x0) > n_sigmas * S0:
+                    new_series[s, i] = x0
+
+    return new_series
+
+
+def timeit(f, *args, repeat=3, **kwargs):
+    best = float("inf")
+    for _ in range(repeat):
+        start = perf_counter()
+        f(*args, **kwargs)
+        best = min(best, perf_counter() - start)
+    return best
+
+
+if __name__ == "__main__":
+    rng = np.random.default_rng(0)
+    n_frames = 200
+    window_size = 4
+
+    print(f"{'subcarriers':>11} {'loop (s)':>10} {'vectorized (s)':>15} {'speedup':>8}")
+    for nsub in [64, 128, 256, 512]:
+        amplitudes = rng.normal(1000, 50, size=(nsub, n_frames))
+        spikes = rng.random(amplitudes.shape) < 0.02
+        amplitudes[spikes] *= 4
+
+        assert np.array_equal(
+            hampel_filter(amplitudes, window_size, nsub),
+            hampel_filter_loop(amplitudes, window_size, nsub)
+        )
+
+        loop = timeit(hampel_filter_loop, amplitudes, window_size, nsub, repeat=1)
+        vectorized = timeit(hampel_filter, amplitudes, window_size, nsub)
+        print(f"{nsub:>11} {loop:>10.4f} {vectorized:>15.4f} {loop / vectorized:>7.0f}x")
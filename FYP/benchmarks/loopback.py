@@ -0,0 +1,101 @@
+import sys
+import glob
+import socket
+import threading
+from time import perf_counter, sleep, time
+from decoders.interleaved import iter_payloads
+from decoders.realtimecsi import read_frame
+from utils.framing import FrameReader, sendFrame
+
+'''
+Loopback transport test
+-----------------------
+
+Replays the Nexmon payloads of data/*.pcap over a TCP
+connection on localhost, the way piClient.py forwards
+them, and counts how many arrive as whole frames that
+read_frame can decode.
+
+"framed" uses utils.framing, "raw" is the old
+sendall/recv(2048) scheme where every recv() was taken
+to be one frame.
+
+Run from the FYP directory (rate in Hz, 0 = no pacing):
+python -m benchmarks.loopback 100
+python -m benchmarks.loopback 0 raw
+'''
+
+BANDWIDTH = 80
+
+
+def loadPayloads(pattern="data/*.pcap"):
+    payloads = []
+    for pcapFile in sorted(glob.glob(pattern)):
+        payloads.extend(payload for timestamp, payload in iter_payloads(pcapFile))
+    return payloads
+
+
+def receive(conn, mode, stats):
+    if mode == "framed":
+        frames = FrameReader(conn)
+    else:
+        frames = iter(lambda: (None, conn.recv(512 * 4)), (None, b''))
+
+    for timestamp, frame in frames:
+        stats["received"] += 1
+        if frame[:2] != b'\x11\x11' or len(frame) < 18 + int(BANDWIDTH * 3.2) * 4:
+            continue
+        if read_frame(frame, BANDWIDTH) == -1:
+            continue
+        stats["decoded"] += 1
+        if timestamp is not None:
+            stats["latency"] += time() - timestamp
+
+
+def replay(payloads, rate=100, mode="framed"):
+    stats = {"sent": len(payloads), "received": 0, "decoded": 0, "latency": 0.0}
+
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as server:
+        server.bind(("127.0.0.1", 0))
+        server.listen(1)
+
+        def serve():
+            conn, addr = server.accept()
+            with conn:
+                receive(conn, mode, stats)
+
+        receiver = threading.Thread(target=serve)
+        receiver.start()
+
+        start = perf_counter()
+        with socket.create_connection(server.getsockname()) as client:
+            for i, payload in enumerate(payloads):
+                if rate:
+                    delay = start + i / rate - perf_counter()
+                    if delay > 0:
+                        sleep(delay)
+                if mode == "framed":
+                    sendFrame(client, payload, time())
+                else:
+                    client.sendall(payload)
+        receiver.join()
+        stats["seconds"] = perf_counter() - start
+
+    return stats
+
+
+if __name__ == "__main__":
+    rate = float(sys.argv[1]) if len(sys.argv) > 1 else 100
+    mode = sys.argv[2] if len(sys.argv) > 2 else "framed"
+
+    payloads = loadPayloads()
+    if rate:
+        # 10 s worth of frames at the requested rate
+        payloads = payloads[:int(10 * rate)]
+
+    stats = replay(payloads, rate, mode)
+    latency = stats["latency"] / stats["decoded"] * 1e3 if stats["decoded"] and mode == "framed" else float("nan")
+    print(f"{mode}: sent {stats['sent']}, received {stats['received']} chunks, "
+          f"decoded {stats['decoded']} frames ({stats['decoded'] / stats['sent']:.1%}) "
+          f"in {stats['seconds']:.2f} s, {stats['decoded'] / stats['seconds']:.0f} frames/s, "
+          f"mean latency {latency:.2f} ms")
@@ -0,0 +1,123 @@
+import sys
+import socket
+import threading
+import multiprocessing
+from time import perf_counter, sleep, thread_time, time
+from benchmarks.loopback import loadPayloads
+from forwarder import UdpForwarder, udpDrops
+from utils.framing import FrameReader, sendFrame
+
+'''
+UDP forwarder benchmark
+-----------------------
+
+Replays the Nexmon payloads of data/*.pcap as UDP
+datagrams on localhost, like the Pi receives them,
+through the piClient.py forwarder to a TCP receiver.
+
+"single" is the recvfrom + sendall per datagram loop,
+"batched" is forwarder.UdpForwarder. The CPU time of
+the forwarder thread is what matters on the Pi.
+
+Run from the FYP directory (rate in Hz, 0 = no pacing,
+and the batch flush window in seconds):
+python -m benchmarks.udpforward 100 batched 0.05
+python -m benchmarks.udpforward 0 single
+'''
+
+
+def forwardSingle(udp, tcp, stop):
+    udp.settimeout(0.1)
+    forwarded = 0
+    while not stop.is_set():
+        try:
+            data, addr = udp.recvfrom(512 * 4)
+        except socket.timeout:
+            continue
+        sendFrame(tcp, data, time())
+        forwarded += 1
+    return {"forwarded": forwarded}
+
+
+def generate(payloads, rate, address):
+    # Runs in its own process, so it does not compete for the GIL
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as generator:
+        start = perf_counter()
+        for i, payload in enumerate(payloads):
+            if rate:
+                delay = start + i / rate - perf_counter()
+                if delay > 0:
+                    sleep(delay)
+            generator.sendto(payload, address)
+
+
+def run(payloads, rate=1000, mode="batched", maxBatch=64, maxLatency=0.05):
+    received = [0]
+    stats = {}
+
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as server, \
+            socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as udp:
+        server.bind(("127.0.0.1", 0))
+        server.listen(1)
+        udp.bind(("127.0.0.1", 0))
+
+        def receive():
+            conn, addr = server.accept()
+            with conn:
+                for timestamp, frame in FrameReader(conn):
+                    received[0] += 1
+
+        receiver = threading.Thread(target=receive)
+        receiver.start()
+
+        tcp = socket.create_connection(server.getsockname())
+        stop = threading.Event()
+        forwarder = UdpForwarder(udp, tcp, maxBatch, maxLatency) if mode == "batched" else None
+
+        def forward():
+            start = thread_time()
+            if mode == "batched":
+                forwarder.run()
+                stats.update(forwarder.stats())
+            else:
+                stats.update(forwardSingle(udp, tcp, stop))
+            stats["cpu"] = thread_time() - start
+            stats["dropped"] = udpDrops(udp)
+
+        forwarding = threading.Thread(target=forward)
+        forwarding.start()
+
+        start = perf_counter()
+        generator = multiprocessing.Process(target=generate, args=(payloads, rate, udp.getsockname()))
+        generator.start()
+        generator.join()
+        seconds = perf_counter() - start
+
+        # Let the forwarder catch up before stopping it
+        sleep(0.5)
+        if forwarder:
+            forwarder.stop()
+        stop.set()
+        forwarding.join()
+        tcp.close()
+        receiver.join()
+
+    stats.update(sent=len(payloads), received=received[0], seconds=seconds)
+    return stats
+
+
+if __name__ == "__main__":
+    rate = float(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    mode = sys.argv[2] if len(sys.argv) > 2 else "batched"
+    maxLatency = float(sys.argv[3]) if len(sys.argv) > 3 else 0.05
+
+    payloads = loadPayloads()
+    if rate:
+        # 5 s worth of frames at the requested rate
+        payloads = (payloads * (1 + int(5 * rate) // len(payloads)))[:int(5 * rate)]
+
+    stats = run(payloads, rate, mode, maxLatency=maxLatency)
+    print(f"{mode}: sent {stats['sent']}, received {stats['received']} "
+          f"({stats['received'] / stats['sent']:.1%}), kernel drops {stats.get('dropped')}, "
+          f"batches {stats.get('batches')}, "
+          f"forwarder CPU {stats['cpu']:.2f} s ({stats['cpu'] / max(stats['received'], 1) * 1e6:.1f} us/frame)")
@@ -1,75 +1,144 @@
 import pandas as pd
 import numpy as np
 import statistics
+import threading
 import matplotlib.pyplot as plt
-from decoders.interleaved import read_pcap
 import os
 from tensorflow.keras.models import load_model
-from scipy.interpolate import interp1d
+from features import activities, FS, DTYPE, loadFromDat
 from utils.matlab import db
-from numpy import inf
+from utils.ringbuffer import RingBuffer
 
 
-activities = ["static", "standing", "walking" , "falling"]
-FS = 100
+class Classifier:
+    """
+        Keeps a Keras model loaded and warmed up so
+        requests don't pay for load_model every time.
 
-def loadFromDat(inputFile, windowSize=FS, step=50):
-    #     print(int((csi_data.nsamples-1)*(100/average_sample_rate)+1))
+        predict() can be shared between threads,
+        calls into the model are serialised.
+    """
 
-    csi_data = read_pcap(inputFile)
-    csi = csi_data.csi
+    def __init__(self, model="current_best_network.h5", dtype=DTYPE):
+        self.model_path = model
+        self.dtype = dtype
+        self.model = load_model(model)
+        self.lock = threading.Lock()
 
-    first_timestamp = float(csi_data.timestamps[0])
-    last_timestamp = float(csi_data.timestamps[-1])
-    final_timestamp = last_timestamp - first_timestamp
-    average_sample_rate = csi_data.nsamples / final_timestamp
+        # The first predict call builds the graph, do it now
+        # with an empty batch of the model's input shape
+        warmup = np.zeros((1,) + tuple(self.model.input_shape[1:]), dtype=self.dtype)
+        self.predict(warmup)
 
-    interp_func = interp1d(csi_data.timestamps, csi_data.csi, kind='linear', axis=0, fill_value="extrapolate")
-    t_new = np.linspace(first_timestamp, last_timestamp, (csi_data.nsamples - 1) * int((100 / average_sample_rate) + 1))
-    csi_interp = interp_func(t_new)
-    csi = csi_interp
+    def predict(self, windows):
+        windows = np.asarray(windows, dtype=self.dtype)
+        with self.lock:
+            return self.model.predict(windows, verbose=0)
 
-    csi = db(np.abs(csi))
-    finalData = csi[:, :, 0]
-    finalData = np.transpose(finalData)
+    def classify(self, pcapFile):
+        x = loadFromDat(pcapFile, dtype=self.dtype)
+        x_pred = self.predict(x)
+        print(x_pred)
+        ensemble = np.argmax(x_pred, axis=1).tolist()
+        mode_value = statistics.mode(ensemble)
+        return f"The activity classified is: {activities[mode_value]}"
 
-    new_average_sample_rate = len(csi_interp) / final_timestamp
 
-    if new_average_sample_rate > FS:
-        downsample_factor = int(new_average_sample_rate / FS)
-        csi = csi[::downsample_factor]
-    index = 0
-    positiveInput = []
+classifiers = {}
+classifiersLock = threading.Lock()
 
-    while index + windowSize <= csi.shape[0]:
-        curFeature = np.zeros((1, windowSize, 256))
-        curFeature[0] = csi[index:index + windowSize, :].reshape(100, 256)
-        positiveInput.append(curFeature)
-        index += step
-    try:
-        positiveInput = np.concatenate(positiveInput, axis=0)
-    except ValueError as e:
-        positiveInput = np.zeros((1, windowSize, 256))
-    positiveInput[positiveInput == -inf] = 0
 
-    return positiveInput
+def getClassifier(model="current_best_network.h5"):
+    # One resident Classifier per model file
+    with classifiersLock:
+        if model not in classifiers:
+            classifiers[model] = Classifier(model)
+        return classifiers[model]
+
 
 def classify(pcapFile, model="current_best_network.h5"):
-    best_network = load_model(model)
-    x = loadFromDat(pcapFile)
-    test_dir = os.path.join("generated/data")
-    pcapFile = f"{test_dir}/generated.pcap"
-    x =loadFromDat(pcapFile)
-    x_pred = best_network.predict(x)
-    print(x_pred)
-    ensemble = []
-    for i in range(len(x_pred)):
-        ensemble.append(np.argmax(x_pred[i]))
-    mode_value = statistics.mode(ensemble)
-    return f"The activity classified is: {activities[mode_value]}"
+    return getClassifier(model).classify(pcapFile)
+
+class StreamClassifier:
+    """
+        Classifies a live CSI feed one frame at a time.
+
+        Magnitudes are put on an FS grid, converted to dB,
+        kept in a windowSize ring buffer and the window is
+        classified every step new samples, like loadFromDat
+        does for a capture.
+
+        csi must be in read_pcap subcarrier order, use
+        np.fft.ifftshift on frames from realtimecsi.read_frame.
+    """
+
+    def __init__(self, classifier, nsub=256, windowSize=FS, step=50, onPrediction=None):
+        self.classifier = classifier
+        self.windowSize = windowSize
+        self.step = step
+        self.onPrediction = onPrediction
+        self.window = RingBuffer(windowSize, nsub, dtype=DTYPE)
+        self.sinceLast = 0
+
+        # Last frame seen and the next point k of the FS grid
+        self.lastTime = None
+        self.lastFrame = None
+        self.startTime = None
+        self.nextIndex = 0
+
+    def resample(self, frame, timestamp):
+        # Linear interpolation onto t0 + k/FS, like interp1d in loadFromDat
+        if self.lastTime is None:
+            self.lastTime, self.lastFrame = timestamp, frame
+            self.startTime, self.nextIndex = timestamp, 1
+            return [frame]
+
+        if timestamp <= self.lastTime:
+            return []
+
+        samples = []
+        # t0 + k/FS rather than adding 1/FS up, so the grid doesn't drift
+        while self.startTime + self.nextIndex / FS <= timestamp:
+            w = (self.startTime + self.nextIndex / FS - self.lastTime) / (timestamp - self.lastTime)
+            samples.append(self.lastFrame * (1 - w) + frame * w)
+            self.nextIndex += 1
+
+        self.lastTime, self.lastFrame = timestamp, frame
+        return samples
+
+    def update(self, csi, timestamp=None):
+        """
+            Adds one CSI frame. Without a timestamp frames
+            are assumed to arrive at FS.
+
+            Returns the (activity, probabilities) predicted
+            because of this frame, usually none or one.
+        """
+
+        # Magnitudes are interpolated and only then put in dB, like loadFromDat
+        frame = np.abs(np.ravel(csi)).astype(DTYPE, copy=False)
+
+        samples = [frame] if timestamp is None else self.resample(frame, timestamp)
+
+        predictions = []
+        for sample in samples:
+            self.window.append(db(sample, dtype=DTYPE, floor=0))
+            self.sinceLast += 1
+            if len(self.window) < self.windowSize or self.sinceLast < self.step:
+                continue
+
+            self.sinceLast = 0
+            probabilities = self.classifier.predict(self.window.latest()[None])[0]
+            activity = activities[int(np.argmax(probabilities))]
+            predictions.append((activity, probabilities))
+            if self.onPrediction is not None:
+                self.onPrediction(activity, probabilities)
+
+        return predictions
+
 
 if __name__ == '__main__':
     test_dir = os.path.join("generated/data")
     pcapFile = f"{test_dir}/walking.pcap"
     model = "current_best_network.h5"
-    print(classify(pcapFile, model))
\ No newline at end of file
+    print(classify(pcapFile, model))
@@ -0,0 +1,154 @@
+import os
+import glob
+import json
+import random
+import threading
+import numpy as np
+from decoders.interleaved import read_pcap
+from plotters.render import renderHeatmap, RENDER_VERSION
+
+'''
+Corpus index
+------------
+
+Index of the pcap captures in data/, grouped by activity
+(the part of the file name before the first '-').
+
+For every file it keeps its metadata (duration, sample
+rate, bandwidth and source MACs) and the path of its
+pre-rendered heatmap, so the app can pick and show a
+capture without decoding or plotting anything.
+Heatmaps are rendered after the metadata of all files
+is available, "plot" is None until then.
+
+The index is saved next to the feature cache and only
+files that were added or changed since are processed
+again when it is refreshed.
+
+Usage
+-----
+
+from corpus import CorpusIndex
+
+corpus = CorpusIndex("data")
+corpus.start()
+entry = corpus.randomEntry("walking")
+'''
+
+__all__ = [
+    'CorpusIndex'
+]
+
+INDEX_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "corpus.json")
+
+
+def describe(pcapFile):
+    # Metadata of a capture, only the headers are read
+    samples = read_pcap(pcapFile, mmap=True)
+    macs = np.unique(samples.mac_keys)
+
+    return {
+        "path": pcapFile,
+        "nsamples": int(samples.nsamples),
+        "duration": samples.duration,
+        "sample_rate": samples.avg_sample_rate,
+        "bandwidth": samples.bandwidth,
+        "macs": [':'.join(f"{int(mac):012x}"[i:i+2] for i in range(0, 12, 2)) for mac in macs],
+    }
+
+
+class CorpusIndex:
+    def __init__(self, directory, indexPath=INDEX_PATH, refreshInterval=60):
+        self.directory = directory
+        self.indexPath = indexPath
+        self.refreshInterval = refreshInterval
+
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.byActivity = {}
+        self.stopped = threading.Event()
+
+        if os.path.exists(indexPath):
+            with open(indexPath) as f:
+                self.entries = json.load(f)
+            self.group()
+
+    def start(self):
+        # Refreshes in the background now and every refreshInterval seconds
+        thread = threading.Thread(target=self.run, daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self):
+        self.stopped.set()
+
+    def run(self):
+        while not self.stopped.is_set():
+            self.refresh()
+            self.stopped.wait(self.refreshInterval)
+
+    def refresh(self):
+        paths = sorted(glob.glob(os.path.join(self.directory, "*.pcap")))
+
+        entries = {}
+        changed = False
+        for path in paths:
+            stat = os.stat(path)
+            signature = [stat.st_size, stat.st_mtime]
+
+            entry = self.entries.get(path)
+            if entry is None or entry["signature"] != signature:
+                try:
+                    entry = describe(path)
+                except Exception as e:
+                    print(f"Could not index {path}: {e}")
+                    continue
+                entry["signature"] = signature
+                entry["activity"] = os.path.basename(path).split("-")[0].lower()
+                entry["plot"] = None
+                changed = True
+
+            entries[path] = entry
+
+        changed = changed or len(entries) != len(self.entries)
+        with self.lock:
+            self.entries = entries
+            self.group()
+
+        # Metadata is published first, heatmaps follow,
+        # until then the app renders them on demand. Cached plots
+        # are redone if the PNG is gone or RENDER_VERSION changed
+        for path, entry in entries.items():
+            plot = entry.get("plot")
+            if plot is None or entry.get("render_version") != RENDER_VERSION or not os.path.exists(plot):
+                entry["plot"] = renderHeatmap(path)
+                entry["render_version"] = RENDER_VERSION
+                changed = True
+
+        if changed:
+            self.save()
+
+    def group(self):
+        byActivity = {}
+        for entry in self.entries.values():
+            byActivity.setdefault(entry["activity"], []).append(entry)
+        self.byActivity = byActivity
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.indexPath), exist_ok=True)
+        tmpPath = f"{self.indexPath}.tmp"
+        with open(tmpPath, "w") as f:
+            json.dump(self.entries, f)
+        os.replace(tmpPath, self.indexPath)
+
+    def activities(self):
+        with self.lock:
+            return sorted(self.byActivity)
+
+    def randomEntry(self, activity):
+        # None if no capture of this activity is indexed (yet)
+        with self.lock:
+            entries = self.byActivity.get(activity.lower())
+            if not entries:
+                return None
+            return random.choice(entries)
@@ -5,7 +5,9 @@ Interleaved
 Fast and efficient methods to extract
 Interleaved CSI samples in PCAP files.
 
-~230k samples per second.
+~230k samples per second, several times
+more when all frames have the same length
+and the file is read as a structured array.
 
 Suitable for bcm43455c0 and bcm4339 chips.
 
@@ -21,13 +23,28 @@ samples = decoder.read_pcap('path_to_pcap_file')
 Bandwidth is inferred from the pcap file, but
 can also be explicitly set:
 samples = decoder.read_pcap('path_to_pcap_file', bandwidth=40)
+
+Large captures can be memory-mapped instead:
+samples = decoder.read_pcap('path_to_pcap_file', mmap=True)
+
+or read in blocks of a fixed number of packets:
+for samples in decoder.iter_pcap('path_to_pcap_file', chunk_packets=1000):
+    ...
+
+The raw Nexmon payloads (what the Pi receives on UDP
+port 5500) can be replayed with:
+for timestamp, payload in decoder.iter_payloads('path_to_pcap_file'):
+    ...
 '''
 
 __all__ = [
-    'read_pcap'
+    'read_pcap',
+    'iter_pcap',
+    'iter_payloads'
 ]
 
 import os
+from mmap import mmap as memory_map, ACCESS_READ
 import numpy as np
 
 # Indexes of Null and Pilot OFDM subcarriers
@@ -80,12 +97,99 @@ class SampleSet(object):
     '''
         A helper class to contain data read
         from pcap files.
+
+        Timestamps are a float64 array of
+        seconds since the epoch.
+
+        CSI is kept as raw int16 pairs and only
+        converted to complex (complex64 by default)
+        the first time the csi attribute is accessed.
     '''
-    def __init__(self, samples, bandwidth):
-        self.timestamps, self.rssi, self.fctl, self.mac, self.seq, self.css, self.csi = samples
+    def __init__(self, samples, bandwidth, dtype=np.complex64):
+        self.timestamps, self.rssi, self.fctl, self.mac, self.seq, self.css, self.csi_raw = samples
 
-        self.nsamples = self.csi.shape[0]
+        self.nsamples = self.csi_raw.shape[0]
         self.bandwidth = bandwidth
+        self.dtype = np.dtype(dtype)
+        self._csi = None
+
+        # Seconds between first and last sample
+        # and the average number of samples per second
+        if self.nsamples > 1:
+            self.duration = float(self.timestamps[-1] - self.timestamps[0])
+        else:
+            self.duration = 0.0
+
+        if self.duration > 0:
+            self.avg_sample_rate = self.nsamples / self.duration
+        else:
+            self.avg_sample_rate = 0.0
+
+    @property
+    def csi(self):
+        if self._csi is None:
+            # Convert CSI bytes to complex numbers
+            real_dtype = np.finfo(self.dtype).dtype
+            csi = self.csi_raw.astype(real_dtype).view(self.dtype)
+            self._csi = csi.reshape(self.nsamples, -1, 1)
+
+        return self._csi
+
+    @property
+    def macs(self):
+        # (nsamples, 6) uint8, one Source Mac ID per row
+        return self.mac
+
+    @property
+    def mac_keys(self):
+        # Source Mac IDs packed into uint64, e.g. for np.unique
+        shifts = np.arange(40, -1, -8, dtype=np.uint64)
+        return np.bitwise_or.reduce(self.mac.astype(np.uint64) << shifts, axis=1)
+
+    @property
+    def seq_numbers(self):
+        return self.seq >> 4
+
+    @property
+    def frag_numbers(self):
+        return self.seq & 0xF
+
+    @property
+    def core(self):
+        return self.css & 0x7
+
+    @property
+    def spatial_stream(self):
+        return (self.css >> 3) & 0x7
+
+    def select(self, mask):
+        '''
+            Returns a SampleSet with only the
+            samples picked by mask, which can be
+            a slice, a boolean array or indices.
+
+            Slices are views of this SampleSet,
+            masks and indices copy only the
+            selected samples.
+        '''
+
+        samples = SampleSet(
+            (
+                self.timestamps[mask],
+                self.rssi[mask],
+                self.fctl[mask],
+                self.mac[mask],
+                self.seq[mask],
+                self.css[mask],
+                self.csi_raw[mask],
+            ),
+            self.bandwidth,
+            self.dtype
+        )
+        if self._csi is not None:
+            samples._csi = self._csi[mask]
+
+        return samples
 
     def get_timestamp(self, index):
         return self.timestamps[index]
@@ -98,21 +202,17 @@ class SampleSet(object):
         return self.fctl[index]
 
     def get_mac(self, index):
-        return self.mac[index*6: (index+1)*6]
+        return self.mac[index].tobytes()
 
     def get_seq(self, index):
-        sc = int.from_bytes( #uint16: SC
-            self.seq[index*2: (index+1)*2],
-            byteorder = 'little',
-            signed = False
-        )
+        sc = int(self.seq[index]) #uint16: SC
         fn = sc % 16 # Fragment Number
         sc = int((sc - fn)/16) # Sequence Number
 
         return (sc, fn)
     
     def get_css(self, index):
-        return self.css[index*2: (index+1)*2]
+        return self.css[index: index+1].tobytes()
 
     def get_csi(self, index, rm_nulls=False, rm_pilots=False):
         csi = self.csi[index: index+256].copy()
@@ -217,57 +317,99 @@ def __find_nsamples_max(pcap_filesize, nsub):
 
     return nsamples_max
 
-def read_pcap(pcap_filepath, bandwidth=0, nsamples_max=0):
+def __record_dtype(nsub, frame_len):
     '''
-        Reads CSI samples from
-        a pcap file. A SampleSet
-        object is returned.
+        Returns a NumPy structured dtype describing
+        one pcap record holding a Nexmon frame of
+        frame_len bytes with nsub subcarriers.
 
-        Bandwidth and maximum samples
-        are inferred from the pcap file by
-        default, but you can also set them explicitly.
+        Offsets are relative to the start of the
+        16 byte pcap packet header.
     '''
 
-    pcap_filesize = os.stat(pcap_filepath).st_size
-    with open(pcap_filepath, 'rb') as pcapfile:
-        fc = pcapfile.read()
+    # 16 bytes: Packet Header            @ 0 - 16
+    # 42 bytes: Ethernet + IP + UDP      @ 16 - 58
+    # 18 bytes: Nexmon metadata          @ 58 - 76
+    # nsub*4 bytes: CSI Data             @ 76 - 76 + nsub*4
+    return np.dtype({
+        'names': [
+            'ts_sec', 'ts_usec', 'incl_len', 'orig_len',
+            'headers',
+            'magic', 'rssi', 'fctl', 'mac', 'seq', 'css', 'chanspec', 'chip',
+            'csi'
+        ],
+        'formats': [
+            '<u4', '<u4', '<u4', '<u4',
+            'V42',
+            '<u2', 'i1', 'u1', ('u1', 6), '<u2', '<u2', '<u2', '<u2',
+            ('<i2', nsub*2)
+        ],
+        'offsets': [
+            0, 4, 8, 12,
+            16,
+            58, 60, 61, 62, 68, 70, 72, 74,
+            76
+        ],
+        'itemsize': 16 + frame_len
+    })
+
+def __read_fixed(fc, ptr, end, nsub):
+    '''
+        Reads every record between ptr and end
+        with a single np.frombuffer call.
 
-    # PCAP file always starts with a 24 byte header containing:
-    magic_bytes = bytearray(4)
-    version_major = bytearray(2)
-    version_minor = bytearray(2)
-    thiszone = bytearray(4)
-    sigfigs = bytearray(4)
-    snaplen = bytearray(4)
-    network = bytearray(4)
+        Only possible when all frames have the
+        same length. None is returned otherwise,
+        and the caller has to walk the records.
+    '''
 
-    magic_bytes = fc[0:4]
-    version_major = fc[4:6]
-    version_minor = fc[6:8]
-    thiszone = fc[8:12]
-    sigfigs = fc[12:16]
-    snaplen = fc[16:20]
-    network = fc[20:24]
+    if end - ptr < 16:
+        return None
 
-    if bandwidth == 0:
-        bandwidth = __find_bandwidth(
-            # 32-36 is where the incl_len
-            # bytes for the first frame are
-            # located.
-            # https://wiki.wireshark.org/Development/LibpcapFileFormat/
-            fc[32:36]
-        )
-    # Number of OFDM sub-carriers
-    nsub = int(bandwidth * 3.2)
+    frame_len = int.from_bytes(
+        fc[ptr+8: ptr+12],
+        byteorder='little',
+        signed=False
+    )
+    record_len = 16 + frame_len
+
+    # Frames too short to hold the CSI of nsub
+    # subcarriers, or a file that is not a whole
+    # number of records, can't be a fixed layout.
+    if frame_len < 42 + 18 + nsub*4 or (end - ptr) % record_len != 0:
+        return None
+
+    records = np.frombuffer(
+        fc,
+        dtype = __record_dtype(nsub, frame_len),
+        count = (end - ptr) // record_len,
+        offset = ptr
+    )
+    if not np.all(records['incl_len'] == frame_len):
+        return None
+
+    return records
 
-    if nsamples_max == 0:
-        nsamples_max = __find_nsamples_max(pcap_filesize, nsub)
+def __timestamps(ts_sec, ts_usec):
+    '''
+        Combines the ts_sec and ts_usec
+        packet header fields into float64
+        seconds since the epoch.
+    '''
+
+    return ts_sec.astype(np.float64) + ts_usec / 1e+6
+
+def __read_loop(fc, ptr, end, nsub, nsamples_max):
+    '''
+        Reads records one at a time between ptr and end.
+
+        Used when frame lengths differ, e.g.
+        when some packets have zero padding.
+    '''
 
     # Packet Header
     ts_sec = bytearray(nsamples_max * 4)
     ts_usec = bytearray(nsamples_max * 4)
-    incl_len = bytearray(nsamples_max * 4)
-    orig_len = bytearray(nsamples_max * 4)
 
     # Preallocating memory
     rssi = bytearray(nsamples_max * 1)
@@ -277,19 +419,10 @@ def read_pcap(pcap_filepath, bandwidth=0, nsamples_max=0):
     css = bytearray(nsamples_max * 2)
     csi = bytearray(nsamples_max * nsub * 4)
 
-    # Pointer to current location in file.
-    # This is faster than using file.tell()
-    # =24 to skip pcap global header
-    ptr = 24
-    timestamps = []
     nsamples = 0
-    while ptr < pcap_filesize:
+    while ptr < end and nsamples < nsamples_max:
         ts_sec[nsamples*4 : (nsamples+1)*4] = fc[ptr: ptr+4]
         ts_usec[nsamples*4 : (nsamples+1)*4] = fc[ptr+4: ptr+8]
-        secs = float(int.from_bytes(ts_sec[nsamples*4 : (nsamples+1)*4], byteorder="little", signed=False))
-        usecs = (int.from_bytes(ts_usec[nsamples*4 : (nsamples+1)*4], byteorder="little", signed=False))/1e+6
-
-        timestamps.append(secs + usecs)
 
         ptr += 8
         frame_len = int.from_bytes(
@@ -319,33 +452,222 @@ def read_pcap(pcap_filepath, bandwidth=0, nsamples_max=0):
         ptr += (frame_len - 42)
         nsamples += 1
 
-    # Convert CSI bytes to numpy array
-    csi_np = np.frombuffer(
-        csi,
-        dtype = np.int16,
-        count = nsub * 2 * nsamples
+    return (
+        __timestamps(
+            np.frombuffer(ts_sec, dtype='<u4', count=nsamples),
+            np.frombuffer(ts_usec, dtype='<u4', count=nsamples)
+        ),
+        np.frombuffer(rssi, dtype=np.int8, count=nsamples),
+        np.frombuffer(fctl, dtype=np.uint8, count=nsamples),
+        np.frombuffer(mac, dtype=np.uint8, count=nsamples*6).reshape(nsamples, 6),
+        np.frombuffer(seq, dtype='<u2', count=nsamples),
+        np.frombuffer(css, dtype='<u2', count=nsamples),
+        np.frombuffer(csi, dtype=np.int16, count=nsamples*nsub*2).reshape(nsamples, nsub*2),
     )
 
-    x = csi_np.reshape(-1, 2)
-    csi = x.astype(np.float32).view(np.complex64)
-    csi = csi.reshape(nsamples, nsub, 1)
-
-    # Convert RSSI to Two's complement form
-    rssi = np.frombuffer(rssi, dtype=np.int8, count = nsamples)
-
-    return SampleSet(
-        (
-            timestamps,
-            rssi,
-            fctl,
-            mac,
-            seq,
-            css,
-            csi,
-        ),
-        bandwidth
+def __find_records_end(fc, ptr, end, nrecords_max):
+    '''
+        Walks the packet headers from ptr and
+        returns the offset just past the last
+        complete record before end, along with
+        the number of records, stopping after
+        nrecords_max records.
+    '''
+
+    nrecords = 0
+    while nrecords < nrecords_max and ptr + 16 <= end:
+        frame_len = int.from_bytes(
+            fc[ptr+8: ptr+12],
+            byteorder='little',
+            signed=False
+        )
+        if ptr + 16 + frame_len > end:
+            break
+
+        ptr += 16 + frame_len
+        nrecords += 1
+
+    return ptr, nrecords
+
+def __read_records(fc, ptr, end, nsub, nsamples_max):
+    '''
+        Reads the records between ptr and end,
+        up to nsamples_max of them (0 means all).
+
+        Returns the columns a SampleSet
+        is built from.
+    '''
+
+    records = __read_fixed(fc, ptr, end, nsub)
+    if records is None:
+        if nsamples_max == 0:
+            nsamples_max = __find_nsamples_max(end - ptr + 24, nsub)
+
+        return __read_loop(fc, ptr, end, nsub, nsamples_max)
+
+    if nsamples_max:
+        records = records[:nsamples_max]
+
+    return (
+        __timestamps(records['ts_sec'], records['ts_usec']),
+        records['rssi'],
+        records['fctl'],
+        records['mac'],
+        records['seq'],
+        records['css'],
+        records['csi'],
     )
 
+def read_pcap(pcap_filepath, bandwidth=0, nsamples_max=0, mmap=False, dtype=np.complex64):
+    '''
+        Reads CSI samples from
+        a pcap file. A SampleSet
+        object is returned.
+
+        Bandwidth and maximum samples
+        are inferred from the pcap file by
+        default, but you can also set them explicitly.
+
+        When all frames have the same length the
+        file is decoded in a single np.frombuffer
+        call, otherwise packets are read one by one.
+
+        With mmap=True the file is memory-mapped
+        instead of read, and the SampleSet columns
+        are strided views over the mapping. Nothing
+        is copied until CSI is asked for. Files with
+        mixed frame lengths are still copied.
+
+        CSI is complex64 unless another
+        complex dtype is given.
+    '''
+
+    pcap_filesize = os.stat(pcap_filepath).st_size
+    with open(pcap_filepath, 'rb') as pcapfile:
+        if mmap:
+            fc = memory_map(pcapfile.fileno(), 0, access=ACCESS_READ)
+        else:
+            fc = pcapfile.read()
+
+    # PCAP file always starts with a 24 byte header containing:
+    magic_bytes = bytearray(4)
+    version_major = bytearray(2)
+    version_minor = bytearray(2)
+    thiszone = bytearray(4)
+    sigfigs = bytearray(4)
+    snaplen = bytearray(4)
+    network = bytearray(4)
+
+    magic_bytes = fc[0:4]
+    version_major = fc[4:6]
+    version_minor = fc[6:8]
+    thiszone = fc[8:12]
+    sigfigs = fc[12:16]
+    snaplen = fc[16:20]
+    network = fc[20:24]
+
+    if bandwidth == 0:
+        bandwidth = __find_bandwidth(
+            # 32-36 is where the incl_len
+            # bytes for the first frame are
+            # located.
+            # https://wiki.wireshark.org/Development/LibpcapFileFormat/
+            fc[32:36]
+        )
+    # Number of OFDM sub-carriers
+    nsub = int(bandwidth * 3.2)
+
+    # =24 to skip pcap global header
+    samples = __read_records(fc, 24, pcap_filesize, nsub, nsamples_max)
+
+    return SampleSet(samples, bandwidth, dtype)
+
+def iter_pcap(pcap_filepath, chunk_packets=1000, bandwidth=0, dtype=np.complex64):
+    '''
+        Reads CSI samples from a pcap
+        file in blocks, yielding a SampleSet
+        of chunk_packets samples at a time
+        (the last one may be shorter).
+
+        Only one block of the file is held
+        in memory at a time. A record cut by
+        the end of a read is carried over to
+        the next block.
+    '''
+
+    with open(pcap_filepath, 'rb') as pcapfile:
+        # Skip pcap global header
+        pcapfile.read(24)
+
+        # Header of the first packet, used to size reads
+        fc = pcapfile.read(16)
+        if len(fc) < 16:
+            return
+
+        frame_len = int.from_bytes(
+            fc[8:12],
+            byteorder='little',
+            signed=False
+        )
+        if bandwidth == 0:
+            bandwidth = __find_bandwidth(fc[8:12])
+        nsub = int(bandwidth * 3.2)
+
+        chunk_size = chunk_packets * (16 + frame_len)
+        eof = False
+        while True:
+            end, nsamples = __find_records_end(fc, 0, len(fc), chunk_packets)
+
+            if nsamples < chunk_packets and not eof:
+                data = pcapfile.read(chunk_size)
+                eof = len(data) == 0
+                fc += data
+                continue
+
+            if nsamples == 0:
+                return
+
+            yield SampleSet(
+                __read_records(fc, 0, end, nsub, nsamples),
+                bandwidth,
+                dtype
+            )
+            fc = fc[end:]
+
+def iter_payloads(pcap_file):
+    '''
+        Yields (timestamp, payload) for every
+        packet in a pcap file, the payload being
+        the UDP data sent by Nexmon (magic bytes,
+        metadata and CSI) without the 42 bytes of
+        Ethernet, IP and UDP headers.
+
+        pcap_file can also be an open binary
+        stream, e.g. the stdout of tcpdump -w -,
+        records are yielded as soon as they are
+        complete.
+    '''
+
+    if isinstance(pcap_file, (str, os.PathLike)):
+        with open(pcap_file, 'rb') as pcapfile:
+            yield from iter_payloads(pcapfile)
+        return
+
+    # Skip pcap global header
+    pcap_file.read(24)
+
+    while True:
+        header = pcap_file.read(16)
+        if len(header) < 16:
+            return
+
+        ts_sec, ts_usec, incl_len = np.frombuffer(header, dtype='<u4', count=3)
+        record = pcap_file.read(int(incl_len))
+        if len(record) < incl_len:
+            return
+
+        yield int(ts_sec) + int(ts_usec) / 1e6, record[42:]
+
 if __name__ == "__main__":
     samples = read_pcap('../listener/data/static0.pcap')
     x = samples.get_csi(0)
@@ -19,12 +19,16 @@ __all__ = [
     'read_frame',
     'hampel_filter',
     'moving_average',
-    'searchVariance'
+    'searchVariance',
+    'topVariance',
+    'SlidingVariance',
+    'MovingAverageFilter',
+    'RunningMedianFilter',
+    'HampelFilter'
 ]
 import os
 import numpy as np
 # from numba import jit
-from statistics import variance
 
 np.seterr(all="ignore")
 
@@ -87,22 +91,60 @@ class SampleSet(object):
         self.nsamples = self.csi.shape[0]
         self.bandwidth = bandwidth
 
+    @property
+    def macs(self):
+        # (nsamples, 6) uint8, one Source Mac ID per row
+        return self.mac
+
+    @property
+    def mac_keys(self):
+        # Source Mac IDs packed into uint64, e.g. for np.unique
+        shifts = np.arange(40, -1, -8, dtype=np.uint64)
+        return np.bitwise_or.reduce(self.mac.astype(np.uint64) << shifts, axis=1)
+
+    @property
+    def seq_numbers(self):
+        return self.seq >> 4
+
+    @property
+    def frag_numbers(self):
+        return self.seq & 0xF
+
+    @property
+    def core(self):
+        return self.css & 0x7
+
+    @property
+    def spatial_stream(self):
+        return (self.css >> 3) & 0x7
+
+    def select(self, mask):
+        """
+            Returns a SampleSet with only the
+            samples picked by mask, which can be
+            a slice, a boolean array or indices.
+        """
+
+        return SampleSet(
+            (self.mac[mask],
+             self.seq[mask],
+             self.css[mask],
+             self.csi[mask]),
+            self.bandwidth
+        )
+
     def get_mac(self, index):
-        return self.mac[index * 6: (index + 1) * 6]
+        return self.mac[index].tobytes()
 
     def get_seq(self, index):
-        sc = int.from_bytes(  # uint16: SC
-            self.seq[index * 2: (index + 1) * 2],
-            byteorder='little',
-            signed=False
-        )
+        sc = int(self.seq[index])  # uint16: SC
         fn = sc % 16  # Fragment Number
         sc = int((sc - fn) / 16)  # Sequence Number
 
         return sc, fn
 
     def get_css(self, index):
-        return self.css[index * 2: (index + 1) * 2]
+        return self.css[index: index + 1].tobytes()
 
     def get_csi(self, index, rm_nulls=False, rm_pilots=False):
         csi = self.csi[index].copy()
@@ -284,9 +326,9 @@ def read_frame(frame, bandwidth=0, nsamples_max=1):
     )
 
     return SampleSet(
-        (mac,
-         seq,
-         css,
+        (np.frombuffer(mac, dtype=np.uint8).reshape(nsamples, 6),
+         np.frombuffer(seq, dtype='<u2', count=nsamples),
+         np.frombuffer(css, dtype='<u2', count=nsamples),
          csi_cmplx),
         bandwidth
     )
@@ -297,27 +339,52 @@ def read_frame(frame, bandwidth=0, nsamples_max=1):
 
 # reference: https://towardsdatascience.com/outlier-detection-with-hampel-filter-85ddf523c73d
 def hampel_filter(input_series, window_size, n_subcarriers, n_sigmas=3):
+    """
+        Replaces outliers of each subcarrier (row) with the
+        median of the 2*window_size samples around them.
+
+        All windows of all subcarriers are handled at once
+        through a sliding window view of the matrix.
+        Samples at the edges are compared with the first
+        and last full window.
+    """
     new_series = input_series.copy()
     k = 1.4826  # scale factor for Gaussian distribution
     n = len(new_series[0, :])
-    for s in range(n_subcarriers):
-        amplitudeOfSubcarrier = new_series[s, :].copy()
-
-        for i in range(window_size, n - window_size + 1):
-            x0 = np.nanmedian(amplitudeOfSubcarrier[i - window_size:i + window_size])
-            S0 = k * np.nanmedian(np.abs(amplitudeOfSubcarrier[i - window_size:i + window_size] - x0))
-
-            if i - window_size == 0:  # if first and last values not available
-                for j in range(window_size + 1):
-                    if np.abs(amplitudeOfSubcarrier[j] - x0) > n_sigmas * S0:
-                        new_series[s, j] = x0
-            elif i + window_size == n - 1:
-                for j in range(n - window_size, n):
-                    if np.abs(amplitudeOfSubcarrier[j] - x0) > n_sigmas * S0:
-                        new_series[s, j] = x0
-            else:
-                if np.abs(amplitudeOfSubcarrier[i] - x0) > n_sigmas * S0:
-                    new_series[s, i] = x0
+    w = window_size
+    if n < 2 * w:
+        return new_series
+
+    amplitudes = np.asarray(input_series[:n_subcarriers, :])
+    median = np.nanmedian if np.isnan(amplitudes).any() else np.median
+
+    # windows[:, t] covers amplitudes[:, t:t + 2w], i.e. the window of sample i = t + w
+    windows = np.lib.stride_tricks.sliding_window_view(amplitudes, 2 * w, axis=1)
+    x0 = median(windows, axis=-1)
+    S0 = k * median(np.abs(windows - x0[..., None]), axis=-1)
+    threshold = n_sigmas * S0
+
+    filtered = new_series[:n_subcarriers, :]
+
+    # The first window also covers samples 0..w
+    head = amplitudes[:, :w + 1]
+    outliers = np.abs(head - x0[:, :1]) > threshold[:, :1]
+    filtered[:, :w + 1] = np.where(outliers, x0[:, :1], filtered[:, :w + 1])
+
+    # The window of sample n-1-w covers samples n-w..n-1,
+    # sample n-1-w itself is left as it is
+    last = n - 1 - 2 * w
+    centre = np.arange(w + 1, n - w + 1)
+    if last > 0:
+        tail = amplitudes[:, n - w:]
+        outliers = np.abs(tail - x0[:, last:last + 1]) > threshold[:, last:last + 1]
+        filtered[:, n - w:] = np.where(outliers, x0[:, last:last + 1], filtered[:, n - w:])
+        centre = centre[centre != n - 1 - w]
+
+    # Every other sample is compared with its own window
+    t = centre - w
+    outliers = np.abs(amplitudes[:, centre] - x0[:, t]) > threshold[:, t]
+    filtered[:, centre] = np.where(outliers, x0[:, t], filtered[:, centre])
 
     return new_series
 
@@ -340,18 +407,156 @@ def moving_average(input_series, window_size, n_subcarrier):
     return mean_series
 
 
+# Streaming filters
+#
+# They take one frame at a time (one value per subcarrier)
+# and keep their state between calls, so each CSI frame can
+# be filtered as it arrives instead of re-filtering a batch.
+
+class MovingAverageFilter:
+    """
+        Streaming version of moving_average.
+        Each update costs O(1) per subcarrier.
+    """
+
+    def __init__(self, window_size, n_subcarriers):
+        self.window_size = window_size
+        self.frames = np.zeros((window_size, n_subcarriers))
+        self.total = np.zeros(n_subcarriers)
+        self.count = 0
+
+    def update(self, frame):
+        position = self.count % self.window_size
+
+        # Same as moving_average: the mean of the frames seen so far
+        # until the window is full, then the mean of the previous window_size frames
+        if self.count < self.window_size:
+            self.total += frame
+            mean = self.total / (self.count + 1)
+        else:
+            mean = self.total / self.window_size
+            self.total += frame - self.frames[position]
+
+        self.frames[position] = frame
+        self.count += 1
+
+        # Sum again once per window so rounding errors don't build up
+        if position == self.window_size - 1:
+            self.total = self.frames.sum(axis=0)
+
+        return mean
+
+
+class RunningMedianFilter:
+    """
+        Median of the last window_size frames,
+        including the current one.
+    """
+
+    def __init__(self, window_size, n_subcarriers):
+        self.window_size = window_size
+        self.frames = np.zeros((window_size, n_subcarriers))
+        self.count = 0
+
+    def update(self, frame):
+        self.frames[self.count % self.window_size] = frame
+        self.count += 1
+
+        return np.median(self.frames[:self.count], axis=0)
+
+
+class HampelFilter:
+    """
+        Streaming version of hampel_filter.
+
+        A sample is judged against the window_size samples before
+        and after it, so update() returns the filtered frame from
+        window_size - 1 frames ago, or None until the window is full.
+    """
+
+    def __init__(self, window_size, n_subcarriers, n_sigmas=3):
+        self.window_size = window_size
+        self.n_sigmas = n_sigmas
+        self.frames = np.zeros((2 * window_size, n_subcarriers))
+        self.count = 0
+
+    def update(self, frame):
+        self.frames[self.count % len(self.frames)] = frame
+        self.count += 1
+        if self.count < len(self.frames):
+            return None
+
+        k = 1.4826  # scale factor for Gaussian distribution
+        x0 = np.median(self.frames, axis=0)
+        S0 = k * np.median(np.abs(self.frames - x0), axis=0)
+
+        sample = self.frames[(self.count - self.window_size) % len(self.frames)]
+        return np.where(np.abs(sample - x0) > self.n_sigmas * S0, x0, sample)
+
+
 def searchVariance(input_series, n_subport, k=12):
-    # returns the amplitudes with the most variance and their appropriate subcarriers
-    varianciesPerSubcarrier = {}
+    # returns the subcarriers with the most variance, highest first
+    # ddof=1 gives the sample variance, like statistics.variance
+    variances = np.var(input_series[:n_subport, :], axis=1, ddof=1)
+    return topVariance(variances, k)
+
 
-    for subcarrrier in range(n_subport):
-        amplitudeOfSubcarrier = input_series[subcarrrier, :]
-        v = variance(amplitudeOfSubcarrier)
-        varianciesPerSubcarrier[v] = subcarrrier
+def topVariance(variances, k=12):
+    # indexes of the k largest variances, highest first
+    k = min(k, len(variances))
+    if k <= 0:
+        return []
+    top = np.argpartition(variances, -k)[-k:]
+    return top[np.argsort(variances[top])[::-1]].tolist()
+
+
+class SlidingVariance:
+    """
+        Sample variance of each subcarrier over
+        the last window_size frames, kept up to date
+        with Welford's algorithm in O(1) per frame.
+    """
 
-    variancies = list(varianciesPerSubcarrier.keys())
-    variancies = sorted(variancies, reverse=True)
-    return [varianciesPerSubcarrier[x] for x in variancies[:k]]
+    def __init__(self, window_size, n_subcarriers):
+        self.window_size = window_size
+        self.frames = np.zeros((window_size, n_subcarriers))
+        self.mean = np.zeros(n_subcarriers)
+        self.m2 = np.zeros(n_subcarriers)
+        self.count = 0
+
+    def update(self, frame):
+        position = self.count % self.window_size
+
+        if self.count < self.window_size:
+            n = self.count + 1
+            delta = frame - self.mean
+            self.mean += delta / n
+            self.m2 += delta * (frame - self.mean)
+        else:
+            # Replace the oldest frame with the new one
+            oldest = self.frames[position]
+            mean = self.mean + (frame - oldest) / self.window_size
+            self.m2 += (frame - oldest) * (frame - mean + oldest - self.mean)
+            self.mean = mean
+
+        self.frames[position] = frame
+        self.count += 1
+
+        # Start again from the stored window once per window
+        # so rounding errors don't build up
+        if position == self.window_size - 1:
+            self.mean = self.frames.mean(axis=0)
+            self.m2 = ((self.frames - self.mean) ** 2).sum(axis=0)
+
+    @property
+    def variance(self):
+        n = min(self.count, self.window_size)
+        if n < 2:
+            return np.zeros_like(self.m2)
+        return np.maximum(self.m2, 0) / (n - 1)
+
+    def top(self, k=12):
+        return topVariance(self.variance, k)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,213 @@
+import os
+import glob
+import hashlib
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from decoders.interleaved import read_pcap
+from utils.matlab import db
+
+'''
+Features
+--------
+
+Turns pcap captures into the (windows, FS, subcarriers)
+float32 tensors the classifier is trained on.
+The precision is set by DTYPE, and CACHE_DTYPE
+for the windows kept on disk.
+
+Windows are cached on disk, keyed by a hash of the
+pcap contents and the windowing parameters, so a
+capture is only decoded again when it changes.
+
+Usage
+-----
+
+from features import loadDataForActivities
+
+x_all, y_all = loadDataForActivities("data")
+'''
+
+activities = ["static", "standing", "walking", "falling"]
+FS = 100
+
+# Precision of the whole decode -> dB -> window path,
+# float32 is what the Keras model consumes
+DTYPE = np.float32
+# Precision windows are stored with in the cache,
+# np.float16 halves its size
+CACHE_DTYPE = np.float32
+
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache")
+# Bump when loadFromDat changes so stale windows are not reused
+CACHE_VERSION = 3
+
+
+def resample(timestamps, values, fs=FS):
+    """
+        Linearly interpolates values (one row per timestamp)
+        onto a uniform grid starting at the first timestamp.
+
+        The output has exactly fs samples per second:
+        row k is at timestamps[0] + k / fs, for every such
+        time up to the last timestamp, so a capture of
+        duration d gives floor(d * fs) + 1 rows.
+    """
+
+    timestamps = np.asarray(timestamps, dtype=np.float64)
+    if len(timestamps) < 2:
+        return values
+
+    nsamples = int(np.floor((timestamps[-1] - timestamps[0]) * fs)) + 1
+    grid = timestamps[0] + np.arange(nsamples) / fs
+
+    # Sample before each grid point and the weight of the one after it
+    before = np.searchsorted(timestamps, grid, side='right') - 1
+    before = np.clip(before, 0, len(timestamps) - 2)
+    dt = timestamps[before + 1] - timestamps[before]
+    weight = np.divide(grid - timestamps[before], dt, out=np.zeros_like(grid), where=dt > 0)
+    weight = weight.astype(values.dtype)[:, None]
+
+    return values[before] * (1 - weight) + values[before + 1] * weight
+
+
+def loadFromDat(inputFile, windowSize=FS, step=50, dtype=DTYPE):
+    # Complex dtype with the same precision, e.g. complex64 for float32
+    csi_data = read_pcap(inputFile, dtype=np.result_type(dtype, np.complex64))
+
+    # Magnitudes straight onto the FS grid, in dtype throughout
+    amplitudes = np.abs(csi_data.csi[:, :, 0]).astype(dtype, copy=False)
+    amplitudes = resample(csi_data.timestamps, amplitudes, FS)
+    # Zero amplitudes (null subcarriers) become 0 dB
+    csi = db(amplitudes, out=amplitudes, floor=0)
+
+    windows = slidingWindows(csi, windowSize, step)
+    if len(windows) == 0:
+        return np.zeros((1, windowSize, csi.shape[1]), dtype=dtype)
+
+    # The only copy of the windows
+    return np.ascontiguousarray(windows, dtype=dtype)
+
+
+def slidingWindows(csi, windowSize=FS, step=50):
+    """
+        Returns the (nwindows, windowSize, nsub) windows of
+        csi (one row per sample), starting every step rows.
+
+        This is a strided view of csi, nothing is copied.
+    """
+
+    if csi.shape[0] < windowSize:
+        return np.zeros((0, windowSize) + csi.shape[1:], dtype=csi.dtype)
+
+    windows = np.lib.stride_tricks.sliding_window_view(csi, windowSize, axis=0)[::step]
+    # sliding_window_view puts the window axis last
+    return np.moveaxis(windows, -1, 1)
+
+
+def cachePath(inputFile, windowSize=FS, step=50, cacheDir=CACHE_DIR):
+    # Content hash, so renamed or re-copied captures still hit the cache
+    sha1 = hashlib.sha1()
+    with open(inputFile, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            sha1.update(block)
+    sha1.update(f"{CACHE_VERSION}-{windowSize}-{step}-{np.dtype(CACHE_DTYPE).name}".encode())
+
+    return os.path.join(cacheDir, f"{sha1.hexdigest()}.npy")
+
+
+def loadCached(inputFile, windowSize=FS, step=50, cacheDir=CACHE_DIR):
+    """
+        Same as loadFromDat, but the windows are read
+        from / written to cacheDir, stored as CACHE_DTYPE
+        and returned as DTYPE.
+    """
+
+    path = cachePath(inputFile, windowSize, step, cacheDir)
+    if os.path.exists(path):
+        return np.load(path).astype(DTYPE, copy=False)
+
+    # Round trip through CACHE_DTYPE so hits and misses return the same values
+    windows = loadFromDat(inputFile, windowSize=windowSize, step=step).astype(CACHE_DTYPE, copy=False)
+
+    # Write to a temporary file first so concurrent
+    # loaders never see a half written cache entry
+    os.makedirs(cacheDir, exist_ok=True)
+    tmpPath = f"{path}.{os.getpid()}.tmp"
+    with open(tmpPath, 'wb') as f:
+        np.save(f, windows)
+    os.replace(tmpPath, path)
+
+    return windows.astype(DTYPE, copy=False)
+
+
+def loadFiles(inputFiles, windowSize=FS, step=50, cacheDir=CACHE_DIR, workers=None):
+    """
+        Returns the windows of each input file, in order.
+
+        Files missing from the cache are decoded in
+        a pool of worker processes (one per core by
+        default, workers=1 decodes in this process).
+    """
+
+    results = [None] * len(inputFiles)
+    missing = []
+    for i, inputFile in enumerate(inputFiles):
+        path = cachePath(inputFile, windowSize, step, cacheDir)
+        if os.path.exists(path):
+            results[i] = np.load(path).astype(DTYPE, copy=False)
+        else:
+            missing.append(i)
+
+    if workers == 1 or len(missing) < 2:
+        for i in missing:
+            results[i] = loadCached(inputFiles[i], windowSize, step, cacheDir)
+        return results
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        windows = executor.map(
+            loadCached,
+            [inputFiles[i] for i in missing],
+            [windowSize] * len(missing),
+            [step] * len(missing),
+            [cacheDir] * len(missing),
+            chunksize=4
+        )
+        for i, w in zip(missing, windows):
+            results[i] = w
+
+    return results
+
+
+def loadByActivityLabel(directory, activity, activities=activities, windowSize=FS, step=50,
+                        cacheDir=CACHE_DIR, workers=None):
+    activity = activity.lower()
+    if activity not in activities:
+        print("invalid activity: " + activity)
+
+    dataPathPattern = os.path.join(directory, "{}*.pcap".format(activity))
+    inputFiles = sorted(glob.glob(dataPathPattern, recursive=True))
+
+    inputWindows = loadFiles(inputFiles, windowSize=windowSize, step=step, cacheDir=cacheDir, workers=workers)
+    inputArray = np.concatenate(inputWindows, axis=0)
+    outputLabels = np.zeros((inputArray.shape[0], len(activities)))
+    outputLabels[:, activities.index(activity)] = 1
+    return inputArray, outputLabels
+
+
+def loadDataForActivities(directory, activities=activities, windowSize=FS, step=50,
+                          cacheDir=CACHE_DIR, workers=None):
+    x_all = []
+    y_all = []
+    for activity in activities:
+        inputArray, outputLabels = loadByActivityLabel(directory, activity, activities, windowSize=windowSize,
+                                                       step=step, cacheDir=cacheDir, workers=workers)
+        x_all.append(inputArray)
+        y_all.append(outputLabels)
+    x_all = np.concatenate(x_all, axis=0)
+    y_all = np.concatenate(y_all, axis=0)
+    return (x_all, y_all)
+
+
+if __name__ == '__main__':
+    x_all, y_all = loadDataForActivities("data")
+    print(x_all.shape, x_all.dtype, y_all.shape)
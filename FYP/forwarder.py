@@ -0,0 +1,154 @@
+import os
+import socket
+import select
+from time import time, monotonic, sleep
+from utils.framing import HEADER
+
+'''
+UDP forwarder
+-------------
+
+Batched version of the piClient.py loop, for the Pi 3B+
+where the CPU and not the network is the limit.
+
+Datagrams are drained from a non-blocking UDP socket
+straight into preallocated slots, each slot keeps room
+for the framing header in front of the payload so
+nothing is copied. Once the first frame of a batch
+arrives the forwarder sleeps for maxLatency, or until
+maxBatch frames are waiting, and sends them all in one
+sendmsg() call: one wakeup and one TCP write per batch
+instead of per datagram.
+
+Datagrams dropped because the socket buffer was full
+are counted by the kernel and read from /proc/net/udp
+(Linux only, None elsewhere). Frames longer than a slot
+are counted as truncated and not sent.
+
+Usage
+-----
+
+from forwarder import UdpForwarder
+
+forwarder = UdpForwarder(udpSocket, tcpSocket, maxBatch=64, maxLatency=0.05)
+forwarder.run()
+print(forwarder.stats())
+'''
+
+__all__ = [
+    'UdpForwarder',
+    'udpDrops'
+]
+
+# Nexmon metadata + CSI of the widest channel (160 MHz, 512 subcarriers)
+MAX_FRAME = 18 + 512 * 4
+
+
+def udpDrops(sock):
+    # Drops column of the socket's line in /proc/net/udp, found by inode
+    inode = str(os.fstat(sock.fileno()).st_ino)
+    for table in ('/proc/net/udp', '/proc/net/udp6'):
+        try:
+            with open(table) as f:
+                for line in f.readlines()[1:]:
+                    fields = line.split()
+                    if fields[9] == inode:
+                        return int(fields[-1])
+        except OSError:
+            pass
+    return None
+
+
+class UdpForwarder:
+    def __init__(self, udpSocket, tcpSocket, maxBatch=64, maxLatency=0.05, slotSize=MAX_FRAME,
+                 receiveBuffer=1024 * 1024):
+        self.udp = udpSocket
+        self.tcp = tcpSocket
+        self.maxBatch = maxBatch
+        self.maxLatency = maxLatency
+
+        self.maxFrame = slotSize
+        # One spare byte so a datagram longer than maxFrame shows up as one
+        self.slotSize = HEADER.size + slotSize + 1
+        self.buffer = bytearray(maxBatch * self.slotSize)
+        self.view = memoryview(self.buffer)
+        # Frames waiting in the slots, as views of header + payload
+        self.pending = []
+        self.oldest = None
+
+        self.udp.setblocking(False)
+        # The kernel has to hold what arrives while we sleep,
+        # Linux caps this at net.core.rmem_max
+        self.udp.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, receiveBuffer)
+
+        self.running = False
+        self.forwarded = 0
+        self.batches = 0
+        self.truncated = 0
+
+    def drain(self):
+        # Reads every datagram already queued, until the batch is full
+        pending = self.pending
+        while len(pending) < self.maxBatch:
+            start = len(pending) * self.slotSize
+            try:
+                nbytes = self.udp.recv_into(self.view[start + HEADER.size:start + self.slotSize])
+            except BlockingIOError:
+                return
+            if nbytes > self.maxFrame:
+                # Filled the slot, the datagram was cut
+                self.truncated += 1
+                continue
+
+            HEADER.pack_into(self.buffer, start, nbytes, time())
+            pending.append(self.view[start:start + HEADER.size + nbytes])
+            if self.oldest is None:
+                self.oldest = monotonic()
+
+    def flush(self):
+        buffers = self.pending
+        while buffers:
+            sent = self.tcp.sendmsg(buffers)
+            # Partial send, skip what went out
+            while buffers and sent >= len(buffers[0]):
+                sent -= len(buffers[0])
+                buffers = buffers[1:]
+            if buffers and sent:
+                buffers = [buffers[0][sent:]] + buffers[1:]
+
+        self.forwarded += len(self.pending)
+        self.batches += 1
+        self.pending = []
+        self.oldest = None
+
+    def run(self, idleTimeout=0.1):
+        self.running = True
+        while self.running:
+            # Wait for the first frame of a batch
+            if not select.select([self.udp], [], [], idleTimeout)[0]:
+                continue
+            self.drain()
+            if not self.pending:
+                # Nothing usable, e.g. only a truncated datagram
+                continue
+
+            # Give the rest of the batch maxLatency to arrive
+            if len(self.pending) < self.maxBatch:
+                delay = self.oldest + self.maxLatency - monotonic()
+                if delay > 0:
+                    sleep(delay)
+                self.drain()
+
+            if self.pending:
+                self.flush()
+
+    def stop(self):
+        self.running = False
+
+    def stats(self):
+        return {
+            "forwarded": self.forwarded,
+            "batches": self.batches,
+            "dropped": udpDrops(self.udp),
+            "truncated": self.truncated
+        }
@@ -0,0 +1,266 @@
+import sys
+import math
+import asyncio
+import inspect
+import numpy as np
+from time import time
+from concurrent.futures import ThreadPoolExecutor
+from decoders.realtimecsi import read_frame
+from recorder import SegmentRecorder
+from utils.framing import HEADER
+from utils.ringbuffer import RingBuffer
+
+'''
+CSI ingestion server
+--------------------
+
+One asyncio server for every Pi running piClient.py,
+instead of one receiver process (and hard-coded IP)
+per Pi.
+
+Frames from all connections are split into streams by
+Pi, source MAC and core/spatial stream. Every stream has
+its own pipeline:
+
+socket -> decode -> RingBuffer of amplitudes -> sink
+
+with a bounded queue before each stage. When a stage
+falls behind its queue fills up, the connection stops
+being read and TCP flow control slows the Pi down, so
+frames are never dropped silently.
+
+A sink is made per stream by sinkFactory(key) and called
+as sink(timestamp, csi), or sink(timestamp, csi, buffer)
+if it takes a buffer argument, buffer ending with this
+frame. It can be a coroutine function and gets the
+RingBuffer, plain functions run in a worker thread and
+get a copy of its latest() window. Without a sinkFactory
+frames only fill the buffers.
+
+With a recorder (recorder.SegmentRecorder) every valid
+frame is also written to the rolling recording.
+
+Usage
+-----
+
+Run from the FYP directory:
+python -m ingest 5501 80            # print stream stats
+python -m ingest 5501 80 classify   # live classification
+python -m ingest 5501 80 record     # and/or keep a rolling recording
+
+from ingest import IngestServer
+
+server = IngestServer(port=5501, sinkFactory=lambda key: print)
+asyncio.run(server.serve())
+'''
+
+__all__ = [
+    'Stream',
+    'IngestServer'
+]
+
+
+class Stream:
+    def __init__(self, key, sink, bandwidth=80, windowSize=200, queueSize=256):
+        self.key = key
+        self.sink = sink
+        # The window is only handed over (and copied) if the sink asks for it
+        self.wantsBuffer = sink is not None and 'buffer' in inspect.signature(sink).parameters
+        self.bandwidth = bandwidth
+        self.nsub = int(bandwidth * 3.2)
+        self.buffer = RingBuffer(windowSize, self.nsub)
+
+        self.frames = asyncio.Queue(maxsize=queueSize)
+        self.decoded = asyncio.Queue(maxsize=queueSize)
+        self.received = 0
+        self.errors = 0
+        self.lastTime = None
+
+        self.tasks = [
+            asyncio.create_task(self.decode()),
+            asyncio.create_task(self.deliver())
+        ]
+
+    async def put(self, timestamp, frame):
+        # Waits while the stream is behind
+        self.received += 1
+        await self.frames.put((timestamp, frame))
+
+    async def decode(self):
+        while True:
+            timestamp, frame = await self.frames.get()
+            frame_info = read_frame(frame, self.bandwidth)
+            if frame_info == -1:
+                self.errors += 1
+            else:
+                self.lastTime = timestamp
+                await self.decoded.put((timestamp, frame_info.csi[0]))
+            self.frames.task_done()
+
+    async def deliver(self):
+        loop = asyncio.get_running_loop()
+        isAsync = inspect.iscoroutinefunction(self.sink)
+        while True:
+            timestamp, csi = await self.decoded.get()
+            # Appended here so the buffer ends with the frame the sink gets
+            self.buffer.append(np.abs(csi))
+            if self.sink is None:
+                self.decoded.task_done()
+                continue
+            try:
+                if isAsync:
+                    args = (self.buffer,) if self.wantsBuffer else ()
+                    await self.sink(timestamp, csi, *args)
+                else:
+                    # A thread sink gets its own copy, the loop keeps appending
+                    args = (self.buffer.latest().copy(),) if self.wantsBuffer else ()
+                    await loop.run_in_executor(None, self.sink, timestamp, csi, *args)
+            except Exception as e:
+                self.errors += 1
+                print(f"{self.name}: sink failed: {e}")
+            self.decoded.task_done()
+
+    async def drain(self):
+        # Waits until every queued frame went through the sink
+        await self.frames.join()
+        await self.decoded.join()
+
+    def close(self):
+        for task in self.tasks:
+            task.cancel()
+
+    @property
+    def name(self):
+        host, mac, css = self.key
+        return f"{host} {mac} core {css & 7} stream {(css >> 3) & 7}"
+
+
+class IngestServer:
+    def __init__(self, host="0.0.0.0", port=5501, bandwidth=80, sinkFactory=None,
+                 windowSize=200, queueSize=256, maxFrame=16 * 1024, recorder=None):
+        self.host = host
+        self.port = port
+        self.bandwidth = bandwidth
+        self.sinkFactory = sinkFactory or (lambda key: None)
+        self.windowSize = windowSize
+        self.queueSize = queueSize
+        self.maxFrame = maxFrame
+        self.recorder = recorder
+        # One writer thread keeps the file writes in order and off the event loop
+        self.recordWriter = ThreadPoolExecutor(max_workers=1) if recorder is not None else None
+
+        self.streams = {}
+        self.connections = 0
+        self.server = None
+
+    def stream(self, key):
+        if key not in self.streams:
+            self.streams[key] = Stream(key, self.sinkFactory(key), self.bandwidth,
+                                       self.windowSize, self.queueSize)
+            print(f"New stream: {self.streams[key].name}")
+        return self.streams[key]
+
+    async def handle(self, reader, writer):
+        host = writer.get_extra_info("peername")[0]
+        self.connections += 1
+        print(f"Connected by {host}")
+        try:
+            while True:
+                length, timestamp = HEADER.unpack(await reader.readexactly(HEADER.size))
+                if length > self.maxFrame:
+                    print(f"{host}: frame of {length} bytes, closing")
+                    break
+                frame = await reader.readexactly(length)
+
+                # checking if the frame is correct
+                if frame[:2] != b'\x11\x11' or len(frame) < 18:
+                    continue
+
+                # Nexmon metadata: source MAC @ 4 - 10, core and spatial stream @ 12 - 14
+                mac = frame[4:10].hex(':')
+                css = int.from_bytes(frame[12:14], 'little')
+                timestamp = time() if math.isnan(timestamp) else timestamp
+                if self.recorder is not None:
+                    await asyncio.get_running_loop().run_in_executor(
+                        self.recordWriter, self.recorder.write, timestamp, frame)
+                await self.stream((host, mac, css)).put(timestamp, frame)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.connections -= 1
+            writer.close()
+            print(f"{host} disconnected")
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self.server
+
+    async def serve(self):
+        await self.start()
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        for stream in self.streams.values():
+            stream.close()
+        if self.recordWriter is not None:
+            self.recordWriter.shutdown()
+            self.recorder.close()
+
+    def stats(self):
+        return {
+            stream.name: {
+                "received": stream.received,
+                "errors": stream.errors,
+                "queued": stream.frames.qsize() + stream.decoded.qsize(),
+                "lastTime": stream.lastTime
+            }
+            for stream in self.streams.values()
+        }
+
+
+def classifierSinks(bandwidth=80):
+    # One StreamClassifier per stream, sharing one batched model
+    from classifier import getClassifier, StreamClassifier
+    from scheduler import BatchScheduler
+
+    scheduler = BatchScheduler(getClassifier())
+
+    def sinkFactory(key):
+        name = f"{key[0]} {key[1]}"
+
+        def onPrediction(activity, probabilities):
+            print(f"{name}: {activity} {np.round(probabilities, 2)}")
+
+        streamClassifier = StreamClassifier(scheduler, nsub=int(bandwidth * 3.2), onPrediction=onPrediction)
+
+        def sink(timestamp, csi):
+            # read_frame fftshifts the subcarriers, the model was trained on read_pcap order
+            streamClassifier.update(np.fft.ifftshift(csi), timestamp=timestamp)
+
+        return sink
+    return sinkFactory
+
+
+async def main(port, bandwidth, modes):
+    server = IngestServer(port=port, bandwidth=bandwidth,
+                          sinkFactory=classifierSinks(bandwidth) if "classify" in modes else None,
+                          recorder=SegmentRecorder() if "record" in modes else None)
+    await server.start()
+    print(f"Waiting for connections on port {server.port}...")
+
+    async with server.server:
+        while True:
+            await asyncio.sleep(5)
+            for name, stats in server.stats().items():
+                print(f"{name}: {stats['received']} frames, {stats['errors']} errors, {stats['queued']} queued")
+
+
+if __name__ == "__main__":
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 5501
+    bandwidth = int(sys.argv[2]) if len(sys.argv) > 2 else 80
+    asyncio.run(main(port, bandwidth, sys.argv[3:]))
@@ -0,0 +1,67 @@
+import uuid
+import threading
+import traceback
+from time import time
+from concurrent.futures import ThreadPoolExecutor
+
+'''
+Background jobs
+---------------
+
+Runs slow work (recording on a Pi, classifying, plotting)
+in worker threads. submit() returns a job id straight away
+and the job can then be polled with get().
+
+Usage
+-----
+
+from jobs import JobQueue
+
+jobs = JobQueue()
+jobId = jobs.submit(recordAndClassify, "walking")
+jobs.get(jobId)  # {"status": "running", ...}
+'''
+
+__all__ = [
+    'JobQueue'
+]
+
+
+class JobQueue:
+    def __init__(self, workers=4, maxJobs=1000):
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.maxJobs = maxJobs
+        self.lock = threading.Lock()
+        self.jobs = {}
+
+    def submit(self, fn, *args, **kwargs):
+        jobId = uuid.uuid4().hex
+        with self.lock:
+            # Forget the oldest jobs, dicts keep insertion order
+            while len(self.jobs) >= self.maxJobs:
+                self.jobs.pop(next(iter(self.jobs)))
+            self.jobs[jobId] = {"id": jobId, "status": "queued", "submitted": time()}
+
+        self.executor.submit(self.run, jobId, fn, args, kwargs)
+        return jobId
+
+    def run(self, jobId, fn, args, kwargs):
+        self.update(jobId, status="running", started=time())
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            traceback.print_exc()
+            self.update(jobId, status="failed", error=str(e), finished=time())
+        else:
+            self.update(jobId, status="done", result=result, finished=time())
+
+    def update(self, jobId, **fields):
+        with self.lock:
+            if jobId in self.jobs:
+                self.jobs[jobId].update(fields)
+
+    def get(self, jobId):
+        # A copy of the job, None if unknown
+        with self.lock:
+            job = self.jobs.get(jobId)
+            return dict(job) if job else None
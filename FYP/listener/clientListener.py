@@ -1,4 +1,13 @@
 import socket
+from time import time
+from recorder import SegmentRecorder
+from utils.framing import FrameReader
+
+# Records the length prefixed frames sent by listener.py / piClient.py
+# into rotating segments (see recorder.py) instead of one output.pcap
+# per connection, the app reads the last seconds from there.
+recorder = SegmentRecorder()
+
 sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
 
 # if using draft2 use this
@@ -14,16 +23,15 @@ while True:
     connection, address = sock.accept()
     print("Connection from: " + str(address))
 
-    with open('output.pcap', 'wb') as f:
-        while True:
-            data = connection.recv(4096)
-            if not data:
-                break
-            f.write(data)
-            print("written")
-        f.close()
+    frames = 0
+    for timestamp, frame in FrameReader(connection):
+        # checking if the frame is correct
+        if frame[:2] != b'\x11\x11':
+            continue
+        # the sender may not set a timestamp
+        recorder.write(time() if timestamp is None else timestamp, frame)
+        frames += 1
+    print(f"written {frames} frames")
 
     connection.close()
 sock.close()
-
-
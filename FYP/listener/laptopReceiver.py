@@ -7,6 +7,8 @@ from decoders.realtimecsi import hampel_filter, moving_average, searchVariance
 # from trial1.plotters.newPlotter import Plotter
 # import trial1.decoders.realtimecsi as decoder
 from decoders.realtimecsi import read_frame
+from utils.framing import FrameReader
+from utils.ringbuffer import RingBuffer
 import socket
 import numpy as np
 import matplotlib.animation as animation
@@ -32,8 +34,8 @@ nsub = bandwidth * 3.2
 # TCP_IP = "192.168.1.6"
 TCP_IP = "192.168.1.228"
 TCP_PORT = 5501
-BUFFER_SIZE = 512*4  # must store the bytes of each packet (n_sub * 4) + header nexmon (18 bytes)
-temporary_frames = np.zeros((2, windowSize, int(nsub)))
+amplitudes = RingBuffer(windowSize, int(nsub))
+phases = RingBuffer(windowSize, int(nsub))
 with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
     s.bind((TCP_IP, TCP_PORT))
     print("Waiting for connections...")
@@ -49,13 +51,11 @@ with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
     n_frame = 0
 
     start = time.time()
-    while n_frame<windowSize:
+    for timestamp, frame in FrameReader(conn):
         # while n_frame < 10:
             # if n_frame %10 ==0:
             #     time.sleep(2)
-            # receiving frames from packets
-        frame = conn.recv(BUFFER_SIZE)
-        print(frame[:2])
+            # receiving whole frames, however TCP split them
         # checking if the frame is correct
         if frame[:2] != b'\x11\x11':
             continue
@@ -73,19 +73,21 @@ with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
         )
         amplitudeValues = np.abs(csi)
         phaseValues = np.angle(csi)
-        temporary_frames[0, n_frame, :] = amplitudeValues
-        temporary_frames[1, n_frame, :] = phaseValues
+        amplitudes.append(amplitudeValues)
+        phases.append(phaseValues)
 
         # plotter.update(csi, n_frame)
         n_frame += 1
         del frame_info
+        if n_frame == windowSize:
+            break
 
 total_time = time.time() - start
 frequency = f"{(n_frame/total_time):.2f}".split(".")
 frequency = "_".join(frequency)
 
-ampDF = pd.DataFrame(temporary_frames[0])
-phaDF = pd.DataFrame(temporary_frames[1])
+ampDF = pd.DataFrame(amplitudes.latest())
+phaDF = pd.DataFrame(phases.latest())
 
 print(frequency)
 
@@ -7,6 +7,7 @@ from decoders.realtimecsi import hampel_filter, moving_average, searchVariance
 from plotters.demo import Plotter
 # import trial1.decoders.realtimecsi as decoder
 from decoders.realtimecsi import read_frame
+from utils.framing import FrameReader
 import socket
 import numpy as np
 import matplotlib.animation as animation
@@ -32,7 +33,6 @@ nsub = bandwidth * 3.2
 # TCP_IP = "192.168.1.6"
 TCP_IP = "192.168.1.228"
 TCP_PORT = 5501
-BUFFER_SIZE = 512*4  # must store the bytes of each packet (n_sub * 4) + header nexmon (18 bytes)
 temporary_frames = np.zeros((2, windowSize, int(nsub)))
 with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
     s.bind((TCP_IP, TCP_PORT))
@@ -49,13 +49,11 @@ with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
     n_frame = 0
 
     start = time.time()
-    while True:
+    for timestamp, frame in FrameReader(conn):
         # while n_frame < 10:
             # if n_frame %10 ==0:
             #     time.sleep(2)
-            # receiving frames from packets
-        frame = conn.recv(BUFFER_SIZE)
-        print(frame[:2])
+            # receiving whole frames, however TCP split them
         # checking if the frame is correct
         if frame[:2] != b'\x11\x11':
             continue
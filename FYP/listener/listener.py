@@ -1,40 +1,52 @@
+import sys
 import socket
 import subprocess
+from decoders.interleaved import iter_payloads
+from utils.framing import sendFrame
 # RAN ON RASPBERRY PI 3B+
-count = 0
-while count<500:
-    tcpdump_process = subprocess.Popen(['sudo', 'tcpdump', '-i', 'wlan0', 'dst', 'port',
-                                    '5500', '-vv', '-w', 'output.pcap', '-c', '1'],
-                                   stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    for line in tcpdump_process.stdout:
-        print(line)
-
-    tcpdump_error = tcpdump_process.communicate()[1]
-
-    if tcpdump_process.returncode == 0:
-        with open("output.pcap", "rb") as f:
-            packets = f.read()
-        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        sock.connect(('169.254.103.233', 1234))
-        sock.sendall(packets)
-        sock.close()
-        print("tcpdump ran successfully")
-        count+=1
-
-    else:
-        print('tcpdump encountered an error:\n', tcpdump_error)
-
-
-# sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-#
-# server_address = ('0.0.0.0', 5501)
-# sock.bind(server_address)
-#
-# print("Listening for UDP packets on port {}...".format(server_address[1]))
-#
-# while True:
-#     data, address = sock.recvfrom(4096)
-#
-#     print("Received {} bytes from {}: {}".format(len(data, address, data)))
+
+# One tcpdump for the whole session, writing pcap to stdout (-w -)
+# unbuffered (-U) so every packet is passed on as soon as it's captured.
+# The records are parsed as they arrive and sent, length prefixed,
+# over one connection to the laptop (ingest.py or a laptopReceiver).
 #
-# def my_server():
+# A pcap file can stand in for the live interface:
+# python -m listener.listener data/walking-1.pcap 127.0.0.1 5501
+
+SERVER_IP = '169.254.103.233'
+SERVER_PORT = 5501
+TCPDUMP = ['sudo', 'tcpdump', '-i', 'wlan0', 'dst', 'port', '5500', '-U', '-w', '-']
+
+
+def capture(pcapFile=None):
+    # Binary stream of pcap data and the tcpdump process, if any
+    if pcapFile is not None:
+        return open(pcapFile, 'rb'), None
+    tcpdump_process = subprocess.Popen(TCPDUMP, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    return tcpdump_process.stdout, tcpdump_process
+
+
+def stream(source, sock, count=0):
+    # Sends the packets of source until it ends (or count packets), returns how many were sent
+    sent = 0
+    for timestamp, payload in iter_payloads(source):
+        sendFrame(sock, payload, timestamp)
+        sent += 1
+        if sent == count:
+            break
+    return sent
+
+
+if __name__ == '__main__':
+    pcapFile = sys.argv[1] if len(sys.argv) > 1 else None
+    server = (sys.argv[2], int(sys.argv[3])) if len(sys.argv) > 3 else (SERVER_IP, SERVER_PORT)
+
+    source, tcpdump_process = capture(pcapFile)
+    with source, socket.create_connection(server) as sock:
+        try:
+            print(f"{stream(source, sock)} packets sent")
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if tcpdump_process is not None:
+                tcpdump_process.terminate()
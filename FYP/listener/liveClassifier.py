@@ -0,0 +1,48 @@
+import time
+
+from decoders.realtimecsi import read_frame
+from utils.framing import FrameReader
+from classifier import getClassifier, StreamClassifier
+import socket
+import numpy as np
+
+# Classifies the CSI sent by piClient.py as it arrives,
+# a prediction is made every STEP frames (0.5 s at 100 Hz)
+
+bandwidth = int(input("Bandwidth:"))
+nsub = int(bandwidth * 3.2)
+
+TCP_IP = "192.168.1.228"
+TCP_PORT = 5501
+WINDOW_SIZE = 100
+STEP = 50
+
+
+def onPrediction(activity, probabilities):
+    print(f"{time.strftime('%H:%M:%S')} {activity} {np.round(probabilities, 2)}")
+    if activity == "falling":
+        print("ALERT: fall detected")
+
+
+streamClassifier = StreamClassifier(getClassifier(), nsub=nsub, windowSize=WINDOW_SIZE, step=STEP,
+                                    onPrediction=onPrediction)
+
+with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+    s.bind((TCP_IP, TCP_PORT))
+    print("Waiting for connections...")
+    s.listen(1)
+    conn, addr = s.accept()
+    print('Connected by', addr)
+
+    for timestamp, frame in FrameReader(conn):
+        # checking if the frame is correct
+        if frame[:2] != b'\x11\x11':
+            continue
+
+        frame_info = read_frame(frame, bandwidth)
+        if frame_info == -1:
+            continue
+
+        # read_frame fftshifts the subcarriers, the model was trained on read_pcap order
+        csi = np.fft.ifftshift(frame_info.csi[0])
+        streamClassifier.update(csi, timestamp=timestamp or time.time())
@@ -1,7 +1,18 @@
 import socket
+import time
+
+from utils.framing import sendFrame
+from forwarder import UdpForwarder, MAX_FRAME
 
 UDP_IP = "255.255.255.255"
 UDP_PORT = 5500
+# drain the UDP socket in batches and send them in one write,
+# set to False to forward every datagram as soon as it arrives
+BATCHED = True
+MAX_BATCH = 64
+# seconds a frame may wait for its batch, at 100 Hz this
+# groups ~5 frames per write (a 5 ms window held only one)
+MAX_LATENCY = 0.05
 
 with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
 
@@ -9,14 +20,22 @@ with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
     with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as server_pc:
         server_pc.connect(('169.254.103.233', 5501))
 
-        while True:
+        if BATCHED:
+            forwarder = UdpForwarder(sock, server_pc, maxBatch=MAX_BATCH, maxLatency=MAX_LATENCY)
             try:
-                data, addr = sock.recvfrom(512 * 4)  # buffer size is 2048 + 18 bytes
-                server_pc.sendall(data)
-            except ConnectionError as e:
-                decision = input("Server disconnected. Reconnect? (Y/N)")
-                if decision in ["n", "N"]:
-                    exit(0)
-                else:
-                    continue
-
+                forwarder.run()
+            except (ConnectionError, KeyboardInterrupt):
+                pass
+            print(forwarder.stats())
+        else:
+            while True:
+                try:
+                    data, addr = sock.recvfrom(MAX_FRAME)  # 512 subcarriers * 4 bytes + 18 bytes of nexmon metadata
+                    # length prefixed, TCP does not keep datagram boundaries
+                    sendFrame(server_pc, data, time.time())
+                except ConnectionError as e:
+                    decision = input("Server disconnected. Reconnect? (Y/N)")
+                    if decision in ["n", "N"]:
+                        exit(0)
+                    else:
+                        continue
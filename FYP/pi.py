@@ -0,0 +1,119 @@
+import os
+import glob
+import shlex
+import shutil
+import random
+import threading
+import paramiko
+
+'''
+Raspberry Pi sessions
+---------------------
+
+One persistent SSH connection per Pi, shared by every
+request and job instead of connecting for each command.
+It reconnects on its own if the connection dropped.
+
+FakePi has the same interface and answers locally, a
+recording is a copy of a capture from data/, so the app
+can be tried without a Pi (set FAKE_PI=1).
+
+Usage
+-----
+
+from pi import getSession
+
+pi = getSession("192.168.1.190")
+output = pi.run("ls")
+pi.get("remote.pcap", "local.pcap")
+'''
+
+__all__ = [
+    'PiSession',
+    'FakePi',
+    'getSession'
+]
+
+USERNAME = "pi"
+PASSWORD = "pi1234"
+
+
+class PiSession:
+    def __init__(self, host, username=USERNAME, password=PASSWORD):
+        self.host = host
+        self.username = username
+        self.password = password
+
+        self.ssh = None
+        self.sftp = None
+        # Commands run on their own channels, connecting
+        # and SFTP transfers have to take turns
+        self.lock = threading.Lock()
+
+    def connect(self):
+        with self.lock:
+            transport = self.ssh.get_transport() if self.ssh else None
+            if transport is None or not transport.is_active():
+                self.ssh = paramiko.SSHClient()
+                self.ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+                self.ssh.connect(self.host, username=self.username, password=self.password)
+                self.sftp = None
+            return self.ssh
+
+    def run(self, command):
+        stdin, stdout, stderr = self.connect().exec_command(command)
+        return stdout.read().decode()
+
+    def get(self, remotePath, localPath):
+        ssh = self.connect()
+        with self.lock:
+            if self.sftp is None:
+                self.sftp = ssh.open_sftp()
+            self.sftp.get(remotePath, localPath)
+
+    def close(self):
+        with self.lock:
+            if self.ssh is not None:
+                self.ssh.close()
+            self.ssh = None
+            self.sftp = None
+
+
+class FakePi:
+    def __init__(self, host="fake", dataDir=os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")):
+        self.host = host
+        self.dataDir = dataDir
+        self.recordings = {}
+
+    def run(self, command):
+        # A tcpdump -w <file> "records" a random capture of the activity in the file name
+        words = shlex.split(command)
+        if "tcpdump" in words and "-w" in words:
+            remotePath = words[words.index("-w") + 1]
+            activity = os.path.basename(remotePath).split("-")[0]
+            captures = glob.glob(os.path.join(self.dataDir, f"{activity}-*.pcap"))
+            self.recordings[remotePath] = random.choice(captures or glob.glob(os.path.join(self.dataDir, "*.pcap")))
+        elif words[:1] == ["rm"]:
+            for remotePath in words[1:]:
+                self.recordings.pop(remotePath, None)
+        return ""
+
+    def get(self, remotePath, localPath):
+        shutil.copyfile(self.recordings[remotePath], localPath)
+
+    def close(self):
+        pass
+
+
+sessions = {}
+sessionsLock = threading.Lock()
+
+
+def getSession(host, username=USERNAME, password=PASSWORD):
+    with sessionsLock:
+        if host not in sessions:
+            if os.environ.get("FAKE_PI"):
+                sessions[host] = FakePi(host)
+            else:
+                sessions[host] = PiSession(host, username, password)
+        return sessions[host]
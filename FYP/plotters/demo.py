@@ -1,9 +1,10 @@
 import numpy as np
 import matplotlib.pyplot as plt
-from decoders.realtimecsi import hampel_filter, moving_average, searchVariance
+from decoders.realtimecsi import HampelFilter, MovingAverageFilter, SlidingVariance
 from time import time
 import pandas as pd
 from utils.matlab import db
+from utils.ringbuffer import RingBuffer
 from scipy import signal
 import matplotlib.animation as animation
 from statistics import variance
@@ -43,6 +44,12 @@ class Plotter:
 
         self.window = True
         self.nsub = int(bandwidth * 3.2)
+
+        # Amplitudes are filtered frame by frame as they arrive
+        self.hampel_filter = HampelFilter(window_size=4, n_subcarriers=self.nsub)
+        self.moving_average = MovingAverageFilter(window_size=10, n_subcarriers=self.nsub)
+        # Variance of each subcarrier over the plotted window
+        self.variance = SlidingVariance(window_size=window_size, n_subcarriers=self.nsub)
         # self.fig = plt.figure(figsize=(18, 10))
         # self.ax1 = plt.subplot(311)
 
@@ -54,60 +61,42 @@ class Plotter:
 
         self.fig.suptitle('Nexmon CSI Real Time Explorer')
 
-        # Stores the frames and the values of the subcarriers
-        # Stores amplitude and phase and then stores the values for each subcarrier
-        # I am also storing the frames which serve as a buffer
-        self.temp_frames = np.zeros((2, 256, 200))
+        # Stores the last window_size frames of amplitude and phase,
+        # one row per frame and one column per subcarrier
+        self.amplitudes = RingBuffer(window_size, self.nsub)
+        self.phases = RingBuffer(window_size, self.nsub)
         plt.ion()
         plt.show()
 
     def cascade(self, csi, sequence):
         """
-        This function takes the CSI array and adds a new frame to the last position putting all previous frames
-        one less position. The frame that occupied the first position of the matrix is dropped.
+        This function takes the CSI array and adds a new frame to the last position of the window.
+        Once the window is full, the oldest frame is dropped.
         """
 
         if self._amp:
 
             amplitudes = np.abs(csi)
-            temp_amplitudes = amplitudes
-            # temp_amplitudes = np.reshape(temp_amplitudes, (256,1))
-            # plt.imshow(temp_amplitudes.T,interpolation="nearest", aspect = "auto", cmap="jet")
+            if self.hampel:
+                # None until the filter has seen enough frames
+                amplitudes = self.hampel_filter.update(amplitudes)
+                if amplitudes is None:
+                    return
+            if self.smoothing:
+                amplitudes = self.moving_average.update(amplitudes)
+            self.variance.update(amplitudes)
+            self.amplitudes.append(amplitudes)
+            # plt.imshow(amplitudes.T,interpolation="nearest", aspect = "auto", cmap="jet")
             # self.ax1.set_title("Amplitude")
             # plt.colorbar()
         if self._phase:
             phase = np.angle(csi, deg=True)
-            temp_phase = phase
-
-
-        if self.window:  # when window is full, the frames are appended to the last position
-            for i in range(self.window_size - 1, -1, -1):
-                if self._amp:
-                    copy_amp = np.copy(self.temp_frames[0, :, i][:])
-                    self.temp_frames[0, :, i] = temp_amplitudes
-                    temp_amplitudes = copy_amp
-
-                if self._phase:
-                    copy_phase = np.copy(self.temp_frames[1, :, i])
-                    self.temp_frames[1, :, i] = temp_phase
-                    temp_phase = copy_phase
-
-
-        else:
-            position = sequence % self.window_size  # checking which position the csi will enter the buffer at
-
-            if self._amp:
-                # how we get the amplitude
-                self.temp_frames[0, :, position] = amplitudes
-            if self._phase:
-                # how we get the phase
-                self.temp_frames[1, :, position] = phase
+            self.phases.append(phase)
 
     def update(self, csi, sequence):
         x = csi
         if sequence != 0 and sequence % 2 == 0 and self.window:
-            j = self.temp_frames[0, :, -1 * 2:]
-            j = np.transpose(j)
+            j = self.amplitudes.latest(2)
             sti = self.get_sti(j[1], j[0])
             corr = self.get_correlation_coefficient(j[1], j[0])
             self.sti_values.append(sti)
@@ -148,7 +137,7 @@ class Plotter:
             # mov_vals = np.array(mov_vals)
             # self.ax_mov.plot(range(len(signals)), signals, label=str("movement detected"))
         if sequence % self.var1 == 0 and sequence != 0 and self.window:
-            amplitudes = self.temp_frames[0, :, -1 * self.var1:]
+            amplitudes = self.amplitudes.latest(self.var1)
             # TEST CODE
             # v = np.mean(amplitudes[46, :])
             # if v < 1300:
@@ -157,25 +146,13 @@ class Plotter:
             #     self.variances.append(0)
             # self.ax_mov.plot(range(len(self.variances)), self.variances, label=str("movement detected"))
 
-            if self.hampel:
-                self.temp_frames[0, :, -1 * self.var1:] = hampel_filter(amplitudes,
-                                                                        window_size=4,
-                                                                        n_subcarriers=self.nsub)
-                amplitudes = self.temp_frames[0, :, -1 * self.var1:]
-
-            if self.smoothing:
-                self.temp_frames[0, :, -1 * self.var1:] = moving_average(amplitudes,
-                                                                         n_subcarrier=self.nsub,
-                                                                         window_size=10)
-                amplitudes = self.temp_frames[0, :, -1 * self.var1:]
-
-            # currentSubcarrier = searchVariance(amplitudes, self.nsub, k=12)
-            currentSubcarrier = [46]
+            # Most informative subcarrier in the current window
+            currentSubcarrier = self.variance.top(k=1)
             # Plotting stored values of each subcarrier
             try:
                 for subcarrier in currentSubcarrier:
-                    amplitudes = self.temp_frames[0, subcarrier, :]
-                    phases = self.temp_frames[1, subcarrier, :]
+                    amplitudes = self.amplitudes.latest()[:, subcarrier]
+                    phases = self.phases.latest()[:, subcarrier]
 
                     if self._amp:
                         self.ax_amp.plot(range(self.window_size), amplitudes, label=str(subcarrier))
@@ -33,32 +33,29 @@ class Plotter():
         self.timestamps = self.data.timestamps
 
         # self.temp_frames = np.zeros((2, 3.2*self.bandwidth, 200))
-    def heatmap(self):
-        amplitudes = np.abs(self.csi)
-        dBm = db(amplitudes)
+    def heatmap(self, ax=None):
+        # Draws on ax if given, otherwise on a new pyplot figure
+        dBm = db(self.csi)
         finalData = dBm[:, :, 0]
 
         # subcarriers * amplitude
         finalData = np.transpose(finalData)
         x_label = "Time (s)"
-        x = self.timestamps
-        x = [timestamp - x[0] for timestamp in x]
-        avg_sample_rate = self.data.nsamples / x[-1]
-        xlim = max(x)
+        xlim = self.data.duration
 
         limits = [0, xlim, 1, self.no_subcarriers]
 
-        _, ax = plt.subplots()
+        if ax is None:
+            _, ax = plt.subplots()
         im = ax.imshow(finalData, cmap="jet", extent=limits, aspect="auto")
         cbar = ax.figure.colorbar(im, ax=ax)
         cbar.ax.set_ylabel("Amplitude (dBm)")
 
-        plt.xlabel(x_label)
-        plt.ylabel("Subcarrier Index")
+        ax.set_xlabel(x_label)
+        ax.set_ylabel("Subcarrier Index")
 
         name, ext = os.path.splitext(os.path.basename(self.pcap_file))
-        plt.title(os.path.basename(name))
-        plt.plot()
+        ax.set_title(os.path.basename(name))
         # plt.savefig("/static/images/generated.png")
 
         # plt.show()
@@ -73,16 +70,13 @@ class Plotter():
         sti_values = []
         corr_values = []
 
-        amplitudes = np.abs(self.csi)
-        dBm = db(amplitudes)
+        dBm = db(self.csi)
         finalData = dBm[:, :, 0]
 
         # subcarriers * amplitude
         finalData = np.transpose(finalData)
         x_label = "Time (s)"
-        x = self.timestamps
-        x = [timestamp - x[0] for timestamp in x]
-        avg_sample_rate = self.data.nsamples / x[-1]
+        avg_sample_rate = self.data.avg_sample_rate
 
         prev_frame = self.csi[0]
         for x in range(finalData[0] - 1):
@@ -149,8 +143,7 @@ def heatmap2(data):
     csi = data.csi
     csi_shape = csi[0].shape
 
-    amplitudes = np.abs(csi)
-    dBm = db(amplitudes)
+    dBm = db(csi)
     finalData = dBm[:, :, 0]
 
     # subcarriers * amplitude
@@ -159,10 +152,8 @@ def heatmap2(data):
     no_subcarriers = int(3.2* data.bandwidth)
 
     x_label = "Time (s)"
-    x = data.timestamps
-    x = [timestamp - x[0] for timestamp in x]
-    avg_sample_rate = no_frames/x[-1]
-    xlim = max(x)
+    avg_sample_rate = data.avg_sample_rate
+    xlim = data.duration
 
     limits = [0, xlim, 1, no_subcarriers]
 
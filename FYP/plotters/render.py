@@ -0,0 +1,83 @@
+import os
+import hashlib
+import threading
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from plotters.plotter import Plotter
+
+'''
+Heatmap renderer
+----------------
+
+Renders the heatmap of a pcap file to a PNG without
+touching pyplot's global state, so requests can render
+at the same time.
+
+Each PNG is named after a hash of the pcap contents and
+the plot parameters, and is only rendered once: later
+requests for the same plot get the existing file.
+
+Usage
+-----
+
+from plotters.render import renderHeatmap
+
+plotPath = renderHeatmap('data/walking-1677946656.pcap')
+'''
+
+__all__ = [
+    'renderHeatmap'
+]
+
+PLOT_DIR = os.path.join('static', 'images', 'plots')
+# Bump when the plot changes so old PNGs are not reused
+RENDER_VERSION = 1
+
+# One lock per plot, so concurrent requests for the
+# same plot render it once and the others wait for it
+locks = {}
+locksLock = threading.Lock()
+
+
+def plotKey(pcapFile, **params):
+    sha1 = hashlib.sha1()
+    with open(pcapFile, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            sha1.update(block)
+    sha1.update(f"{RENDER_VERSION}-{os.path.basename(pcapFile)}-{sorted(params.items())}".encode())
+
+    return sha1.hexdigest()
+
+
+def renderHeatmap(pcapFile, plotDir=PLOT_DIR, window_size=200, bandwidth=80, dpi=100):
+    """
+        Returns the path of the heatmap PNG of pcapFile,
+        rendering it first if it is not in plotDir yet.
+    """
+
+    key = plotKey(pcapFile, window_size=window_size, bandwidth=bandwidth, dpi=dpi)
+    path = os.path.join(plotDir, f"{key}.png")
+
+    with locksLock:
+        lock = locks.setdefault(key, threading.Lock())
+
+    with lock:
+        if not os.path.exists(path):
+            fig = Figure()
+            FigureCanvasAgg(fig)
+            try:
+                Plotter(pcapFile, window_size, bandwidth).heatmap(ax=fig.add_subplot())
+
+                # Written under a temporary name so a half written
+                # PNG is never served
+                os.makedirs(plotDir, exist_ok=True)
+                tmpPath = f"{path}.{threading.get_ident()}.tmp.png"
+                fig.savefig(tmpPath, dpi=dpi)
+                os.replace(tmpPath, path)
+            finally:
+                fig.clear()
+
+    with locksLock:
+        locks.pop(key, None)
+
+    return path
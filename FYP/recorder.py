@@ -0,0 +1,233 @@
+import os
+import glob
+import struct
+import threading
+import numpy as np
+from time import time
+
+'''
+Segment recorder
+----------------
+
+Records the frames received from the Pis into pcap files
+that are rotated every segmentSeconds, keeping the last
+maxSegments of them, so the most recent CSI is always on
+disk without any file growing forever.
+
+Segments rotate on this machine's clock. The frames keep
+the sender's timestamps, which can be off between Pis
+(they have no RTC), so a time range is looked up in the
+timestamps of each segment's index, not its name.
+
+Every segment has a sidecar index with one fixed size
+entry per frame:
+
+8 bytes: timestamp                   @ 0 - 8
+8 bytes: byte offset of the record   @ 8 - 16
+6 bytes: source MAC                  @ 16 - 22
+
+so a time range can be cut out of a segment with one
+seek and one read, without scanning it from the start.
+
+Segments are ordinary pcap files (the Ethernet, IP and
+UDP headers are zeroed), read_pcap and the other readers
+work on them and on the files written by export().
+
+Usage
+-----
+
+from recorder import SegmentRecorder
+
+recorder = SegmentRecorder("recordings")
+recorder.write(timestamp, payload)
+
+recorder.export(start, end, "range.pcap")
+recorder.exportLast(3, "last3s.pcap", mac="b4:86:55:f4:8b:9e")
+'''
+
+__all__ = [
+    'SegmentRecorder'
+]
+
+RECORDINGS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "recordings")
+
+INDEX_DTYPE = np.dtype([
+    ('timestamp', '<f8'),
+    ('offset', '<u8'),
+    ('mac', 'u1', 6)
+])
+
+# Little endian pcap, version 2.4, Ethernet
+GLOBAL_HEADER = struct.pack('<IHHiIII', 0xa1b2c3d4, 2, 4, 0, 0, 65535, 1)
+RECORD_HEADER = struct.Struct('<IIII')
+# Ethernet, IP and UDP headers in front of the Nexmon payload
+PADDING = bytes(42)
+
+
+def macBytes(mac):
+    # "aa:bb:cc:dd:ee:ff" as the 6 bytes stored in the index
+    return np.frombuffer(bytes.fromhex(mac.replace(':', '')), dtype=np.uint8)
+
+
+class SegmentRecorder:
+    def __init__(self, directory=RECORDINGS_DIR, segmentSeconds=60, maxSegments=60):
+        self.directory = directory
+        self.segmentSeconds = segmentSeconds
+        self.maxSegments = maxSegments
+        os.makedirs(directory, exist_ok=True)
+
+        self.lock = threading.Lock()
+        self.pcap = None
+        self.index = None
+        self.segmentEnd = None
+        # path: (index size, first and last timestamp) of each segment
+        self.bounds = {}
+
+    def segmentPath(self, start):
+        # Milliseconds, zero padded so names sort by time
+        return os.path.join(self.directory, f"segment-{int(start * 1000):015d}.pcap")
+
+    def segments(self):
+        return sorted(glob.glob(os.path.join(self.directory, "segment-*.pcap")))
+
+    def rotate(self, timestamp):
+        self.close()
+
+        start = timestamp - timestamp % self.segmentSeconds
+        path = self.segmentPath(start)
+        self.pcap = open(path, 'ab')
+        if self.pcap.tell() == 0:
+            self.pcap.write(GLOBAL_HEADER)
+        self.index = open(path[:-len('.pcap')] + '.idx', 'ab')
+        self.segmentEnd = start + self.segmentSeconds
+
+        for old in self.segments()[:-self.maxSegments]:
+            for oldPath in (old, old[:-len('.pcap')] + '.idx'):
+                try:
+                    os.remove(oldPath)
+                except FileNotFoundError:
+                    pass
+
+    def write(self, timestamp, payload):
+        with self.lock:
+            now = time()
+            if self.pcap is None or now >= self.segmentEnd:
+                self.rotate(now)
+
+            offset = self.pcap.tell()
+            length = len(PADDING) + len(payload)
+            self.pcap.write(RECORD_HEADER.pack(int(timestamp), int(timestamp % 1 * 1e6), length, length))
+            self.pcap.write(PADDING)
+            self.pcap.write(payload)
+
+            entry = np.zeros(1, dtype=INDEX_DTYPE)
+            entry['timestamp'] = timestamp
+            entry['offset'] = offset
+            # Nexmon metadata: source MAC @ 4 - 10
+            entry['mac'] = np.frombuffer(payload[4:10], dtype=np.uint8)
+
+            # The record is on disk before the index points at it
+            self.pcap.flush()
+            self.index.write(entry.tobytes())
+            self.index.flush()
+
+    def close(self):
+        for f in (self.pcap, self.index):
+            if f is not None:
+                f.close()
+        self.pcap = self.index = None
+
+    def readIndex(self, path):
+        try:
+            return np.fromfile(path[:-len('.pcap')] + '.idx', dtype=INDEX_DTYPE)
+        except (FileNotFoundError, ValueError):
+            return np.zeros(0, dtype=INDEX_DTYPE)
+
+    def timeRange(self, path):
+        # Oldest and newest timestamp in a segment, None if it is empty
+        try:
+            size = os.path.getsize(path[:-len('.pcap')] + '.idx')
+        except FileNotFoundError:
+            return None
+        if path not in self.bounds or self.bounds[path][0] != size:
+            index = self.readIndex(path)
+            timestamps = index['timestamp']
+            self.bounds[path] = (size, (timestamps.min(), timestamps.max()) if len(index) else None)
+        return self.bounds[path][1]
+
+    def latest(self, maxAge=2, mac=None):
+        '''
+            Timestamp of the newest recorded frame (from
+            mac, if given), None if nothing was recorded
+            in the last maxAge seconds (of this machine's
+            clock).
+        '''
+
+        segments = self.segments()
+        if not segments:
+            return None
+        path = segments[-1]
+        try:
+            if time() - os.path.getmtime(path[:-len('.pcap')] + '.idx') > maxAge:
+                return None
+        except FileNotFoundError:
+            return None
+        index = self.readIndex(path)
+        if mac is not None:
+            index = index[(index['mac'] == macBytes(mac)).all(axis=1)]
+        return float(index['timestamp'][-1]) if len(index) else None
+
+    def export(self, start, end, outputPath, mac=None):
+        '''
+            Writes the frames recorded between start and
+            end (and from mac, "aa:bb:cc:dd:ee:ff", if
+            given) to a new pcap file. Returns how many
+            frames were written.
+        '''
+
+        if mac is not None:
+            mac = macBytes(mac)
+
+        nframes = 0
+        with open(outputPath, 'wb') as out:
+            out.write(GLOBAL_HEADER)
+
+            segments = self.segments()
+            self.bounds = {path: self.bounds[path] for path in segments if path in self.bounds}
+            for path in segments:
+                timeRange = self.timeRange(path)
+                if timeRange is None or timeRange[0] >= end or timeRange[1] < start:
+                    continue
+
+                index = self.readIndex(path)
+                selected = (index['timestamp'] >= start) & (index['timestamp'] < end)
+                if mac is not None:
+                    selected &= (index['mac'] == mac).all(axis=1)
+                selected = np.flatnonzero(selected)
+                if len(selected) == 0:
+                    continue
+
+                try:
+                    with open(path, 'rb') as pcap:
+                        # Runs of consecutive records are copied with one read
+                        for run in np.split(selected, np.flatnonzero(np.diff(selected) > 1) + 1):
+                            first = int(index['offset'][run[0]])
+                            pcap.seek(int(index['offset'][run[-1]]))
+                            length = RECORD_HEADER.unpack(pcap.read(RECORD_HEADER.size))[2]
+                            last = int(index['offset'][run[-1]]) + RECORD_HEADER.size + length
+
+                            pcap.seek(first)
+                            out.write(pcap.read(last - first))
+                            nframes += len(run)
+                except FileNotFoundError:
+                    # Rotated away while reading
+                    continue
+
+        return nframes
+
+    def exportLast(self, seconds, outputPath, maxAge=2, mac=None):
+        # The last seconds up to the newest frame, 0 frames if the recording is stale
+        end = self.latest(maxAge, mac)
+        if end is None:
+            return 0
+        return self.export(end - seconds, np.nextafter(end, np.inf), outputPath, mac)
@@ -0,0 +1,149 @@
+import queue
+import threading
+import numpy as np
+from time import perf_counter
+from collections import deque
+from concurrent.futures import Future
+
+'''
+Batch scheduler
+---------------
+
+Sits in front of a model (anything with a predict(batch)
+method, e.g. classifier.Classifier) and groups the windows
+submitted by many streams into one predict call.
+
+A batch is sent when it holds maxBatch windows or when the
+oldest window in it has waited maxLatency seconds.
+
+Usage
+-----
+
+from classifier import getClassifier
+from scheduler import BatchScheduler
+
+scheduler = BatchScheduler(getClassifier(), maxBatch=32, maxLatency=0.02)
+
+# Same interface as Classifier, so it can be handed to a StreamClassifier
+probabilities = scheduler.predict(windows)
+
+print(scheduler.stats())
+'''
+
+__all__ = [
+    'BatchScheduler'
+]
+
+
+class BatchScheduler:
+    def __init__(self, model, maxBatch=32, maxLatency=0.02, historySize=1000):
+        self.model = model
+        self.maxBatch = maxBatch
+        self.maxLatency = maxLatency
+
+        self.requests = queue.Queue()
+
+        # Recent batch sizes, predict times and per-window latencies
+        self.statsLock = threading.Lock()
+        self.batchSizes = deque(maxlen=historySize)
+        self.predictTimes = deque(maxlen=historySize)
+        self.latencies = deque(maxlen=historySize)
+
+        self.worker = threading.Thread(target=self.run, daemon=True)
+        self.worker.start()
+
+    def submit(self, window):
+        # Returns a Future holding the prediction for one window
+        future = Future()
+        self.requests.put((np.asarray(window), future, perf_counter()))
+        return future
+
+    def predict(self, windows):
+        futures = [self.submit(window) for window in windows]
+        return np.stack([future.result() for future in futures])
+
+    def close(self):
+        self.requests.put(None)
+        self.worker.join()
+
+    def nextBatch(self):
+        first = self.requests.get()
+        if first is None:
+            return None
+
+        batch = [first]
+        deadline = first[2] + self.maxLatency
+        while len(batch) < self.maxBatch:
+            # Requests already waiting join the batch even past the
+            # deadline, only waiting for new ones is bounded by it
+            try:
+                request = self.requests.get_nowait()
+            except queue.Empty:
+                timeout = deadline - perf_counter()
+                if timeout <= 0:
+                    break
+                try:
+                    request = self.requests.get(timeout=timeout)
+                except queue.Empty:
+                    break
+            if request is None:
+                # Finish this batch, then stop
+                self.requests.put(None)
+                break
+            batch.append(request)
+
+        return batch
+
+    def run(self):
+        while True:
+            batch = self.nextBatch()
+            if batch is None:
+                return
+
+            # Windows of different shapes (e.g. 20 and 80 MHz streams)
+            # are predicted separately, a failure only fails its group
+            groups = {}
+            for request in batch:
+                groups.setdefault(request[0].shape, []).append(request)
+
+            for group in groups.values():
+                start = perf_counter()
+                try:
+                    predictions = self.model.predict(np.stack([window for window, _, _ in group]))
+                except Exception as e:
+                    for _, future, _ in group:
+                        future.set_exception(e)
+                    continue
+                end = perf_counter()
+
+                for (_, future, submitted), prediction in zip(group, predictions):
+                    future.set_result(prediction)
+
+                with self.statsLock:
+                    self.batchSizes.append(len(group))
+                    self.predictTimes.append(end - start)
+                    self.latencies.extend(end - submitted for _, _, submitted in group)
+
+    def stats(self):
+        """
+            Batch size and latency (seconds from submit
+            to result) over the recent history.
+        """
+
+        with self.statsLock:
+            batchSizes = np.array(self.batchSizes)
+            predictTimes = np.array(self.predictTimes)
+            latencies = np.array(self.latencies)
+
+        if len(batchSizes) == 0:
+            return {}
+
+        return {
+            "batches": len(batchSizes),
+            "mean_batch_size": float(batchSizes.mean()),
+            "max_batch_size": int(batchSizes.max()),
+            "mean_predict_time": float(predictTimes.mean()),
+            "latency_p50": float(np.percentile(latencies, 50)),
+            "latency_p95": float(np.percentile(latencies, 95)),
+            "latency_max": float(latencies.max()),
+        }
@@ -0,0 +1,101 @@
+import math
+import struct
+
+'''
+Framing
+-------
+
+Wire format for sending Nexmon frames over TCP.
+
+TCP is a byte stream, one recv() can return half a
+frame or several frames glued together, so every frame
+is prefixed with a 12 byte header:
+
+4 bytes: payload length (big endian)   @ 0 - 4
+8 bytes: sender timestamp, NaN if none @ 4 - 12
+
+FrameReader reassembles the stream in a reusable buffer
+and only hands out whole frames, as memoryviews into
+that buffer (valid until the next frame is read).
+
+Usage
+-----
+
+sendFrame(sock, payload, time.time())
+
+for timestamp, frame in FrameReader(conn):
+    frame_info = read_frame(frame, bandwidth)
+'''
+
+__all__ = [
+    'HEADER',
+    'packFrame',
+    'sendFrame',
+    'FrameReader'
+]
+
+HEADER = struct.Struct('!Id')
+
+
+def packFrame(payload, timestamp=None):
+    return HEADER.pack(len(payload), math.nan if timestamp is None else timestamp) + payload
+
+
+def sendFrame(sock, payload, timestamp=None):
+    sock.sendall(packFrame(payload, timestamp))
+
+
+class FrameReader:
+    def __init__(self, sock, bufferSize=64 * 1024, maxFrame=16 * 1024):
+        self.sock = sock
+        self.maxFrame = maxFrame
+        self.buffer = bytearray(max(bufferSize, HEADER.size + maxFrame))
+        self.view = memoryview(self.buffer)
+        # Unread bytes are buffer[start:end]
+        self.start = 0
+        self.end = 0
+
+    def __iter__(self):
+        while True:
+            frame = self.read()
+            if frame is None:
+                return
+            yield frame
+
+    def fill(self, n):
+        # Makes sure n unread bytes are buffered, False on EOF
+        if self.start == self.end:
+            self.start = self.end = 0
+        while self.end - self.start < n:
+            if len(self.buffer) - self.start < n:
+                # Move the partial frame to the front
+                size = self.end - self.start
+                self.view[:size] = self.view[self.start:self.end]
+                self.start, self.end = 0, size
+
+            received = self.sock.recv_into(self.view[self.end:])
+            if received == 0:
+                return False
+            self.end += received
+        return True
+
+    def read(self):
+        '''
+            Returns the next (timestamp, frame),
+            timestamp is None if the sender did
+            not set one. None when the
+            connection is closed.
+        '''
+
+        if not self.fill(HEADER.size):
+            return None
+        length, timestamp = HEADER.unpack_from(self.buffer, self.start)
+        if length > self.maxFrame:
+            raise ValueError(f"Frame of {length} bytes, stream out of sync?")
+
+        if not self.fill(HEADER.size + length):
+            return None
+        start = self.start + HEADER.size
+        self.start = start + length
+
+        return (None if math.isnan(timestamp) else timestamp), self.view[start:self.start]
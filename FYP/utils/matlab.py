@@ -1,14 +1,62 @@
 import numpy as np
-np.seterr(divide="ignore")
 
-def dbinv(x: float) -> float:
-    return np.power(10, x/10)
+# dtype can be given to compute in a specific precision,
+# e.g. np.float32, otherwise it follows the input.
+#
+# With out, the result is written there instead of a new
+# array, out can be x itself for real input.
+# Scalars in give scalars out.
+
+def __result(x, dtype, out):
+    x = np.asarray(x)
+    if out is not None:
+        return x, out
+
+    if dtype is None:
+        if np.iscomplexobj(x):
+            # Magnitude of complex64 is float32, etc.
+            dtype = np.finfo(x.dtype).dtype
+        elif np.issubdtype(x.dtype, np.floating):
+            dtype = x.dtype
+        else:
+            dtype = np.float64
+
+    return x, np.empty(x.shape, dtype=dtype)
+
+def dbinv(x: float, dtype=None, out=None) -> float:
+    x, out = __result(x, dtype, out)
+    np.divide(x, 10, out=out)
+    np.power(10, out, out=out)
+    return out if out.ndim else out[()]
+
+def db(x: float, metric: str="voltage", dtype=None, out=None, floor=None) -> float:
+    '''
+        Decibels of x. Complex x, e.g. CSI,
+        is converted from its magnitude.
+
+        Zeros give -inf, unless floor is set:
+        everything below floor dB, zeros
+        included, is then set to floor.
+        Everything happens in one buffer.
+    '''
 
-def db(x: float, metric: str="voltage") -> float:
     if metric == "voltage":
-        return 20 * np.log10(x)
+        factor = 20
     elif metric == "pow":
-        return 10 * np.log10(x)
+        factor = 10
+    else:
+        return None
+
+    x, out = __result(x, dtype, out)
+    if np.iscomplexobj(x):
+        x = np.abs(x, out=out)
+    if floor is not None:
+        x = np.maximum(x, np.power(10, floor / factor), out=out)
+
+    with np.errstate(divide="ignore"):
+        np.log10(x, out=out)
+    np.multiply(out, factor, out=out)
+    return out if out.ndim else out[()]
 
 def sqtwolog(x: float) -> float:
-    return np.sqrt(2*np.log(len(x)))
\ No newline at end of file
+    return np.sqrt(2*np.log(len(x)))
@@ -0,0 +1,38 @@
+import numpy as np
+
+'''
+Ring buffer
+-----------
+
+Keeps the last `size` CSI frames of `nsub` subcarriers.
+
+Every frame is written twice, at i and i + size, so the
+latest n frames are always one contiguous slice of the
+storage: append is O(nsub) and latest(n) is a view,
+no matter how full the buffer is.
+
+Frames are rows, so latest(n) is (n, nsub), oldest first.
+'''
+
+
+class RingBuffer:
+    def __init__(self, size, nsub, dtype=np.float64):
+        self.size = size
+        self.nsub = nsub
+        self.data = np.zeros((2 * size, nsub), dtype=dtype)
+        self.count = 0
+
+    def __len__(self):
+        return min(self.count, self.size)
+
+    def append(self, frame):
+        i = self.count % self.size
+        self.data[i] = frame
+        self.data[i + self.size] = frame
+        self.count += 1
+
+    def latest(self, n=None):
+        # Frames not written yet are zeros, at most size frames are kept
+        n = self.size if n is None else min(n, self.size)
+        end = (self.count - 1) % self.size + self.size + 1
+        return self.data[end - n:end]